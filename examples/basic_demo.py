@@ -3,8 +3,8 @@ Multi-Agent 交互示例
 演示如何创建和使用多个 Agent 进行协作
 """
 
+import logging
 import sys
-sys.path.insert(0, '..')
 
 from multi_agent import Agent, Orchestrator, MessageBus
 
@@ -156,6 +156,9 @@ def example_broadcast():
 
 
 if __name__ == "__main__":
+    # 显示框架内部的通信日志
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    logging.getLogger("multi_agent").setLevel(logging.DEBUG)
     print("\n🤖 Multi-Agent Interaction 演示")
     print("=" * 50)
     
@@ -2,9 +2,8 @@
 展示如何将真实的 LLM Agent 接入框架
 """
 
+import logging
 import sys
-sys.path.insert(0, '..')
-
 import os
 from multi_agent import MessageBus, Orchestrator
 from multi_agent.llm_agent import (
@@ -200,6 +199,9 @@ def example_openclaw_integration():
 
 
 if __name__ == "__main__":
+    # 显示框架内部的通信日志
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    logging.getLogger("multi_agent").setLevel(logging.DEBUG)
     print("\n🤖 LLM Agent 集成示例")
     print("=" * 50)
     
@@ -3,12 +3,16 @@ OpenClaw Agent 适配器 - 将当前的 AI 会话接入框架
 """
 
 from typing import Any, Optional
-import sys
-sys.path.insert(0, '..')
+import concurrent.futures
+import functools
+import logging
+import re
 
 from multi_agent.agent import Agent, AgentState
 from multi_agent.message import Message
 
+logger = logging.getLogger(__name__)
+
 
 class OpenClawAgent(Agent):
     """
@@ -29,6 +33,37 @@ class OpenClawAgent(Agent):
     )
     """
     
+    __slots__ = ("capabilities", "_task_handlers")
+    
+    # 任务类型关键词，按优先级排列
+    TASK_KEYWORDS = {
+        "search": ["搜索", "查找", "search", "find", "查询"],
+        "code": ["代码", "编程", "code", "python", "javascript", "实现"],
+        "files": ["文件", "读取", "写入", "file", "read", "write", "保存"],
+        "browser": ["网页", "打开", "点击", "browser", "website", "url"],
+        "analysis": ["分析", "统计", "analysis", "数据", "报告"],
+    }
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._build_task_classifier()
+    
+    @classmethod
+    def _build_task_classifier(cls) -> None:
+        """
+        将 TASK_KEYWORDS 编译为一个正则
+        
+        零宽前瞻使每个位置都被检查（允许关键词重叠），
+        同一位置按类别优先级选取命名分组
+        """
+        groups = "|".join(
+            f"(?P<{category}>{'|'.join(map(re.escape, kws))})"
+            for category, kws in cls.TASK_KEYWORDS.items()
+        )
+        cls._task_pattern = re.compile(f"(?=(?:{groups}))")
+        # 下标与分组编号对齐，0 号位对应整体匹配
+        cls._task_categories = ("general",) + tuple(cls.TASK_KEYWORDS)
+    
     def __init__(
         self,
         name: str = "OpenClaw",
@@ -74,34 +109,32 @@ class OpenClawAgent(Agent):
     
     def _classify_task(self, task: str) -> str:
         """分类任务类型"""
-        task_lower = task.lower()
-        
-        # 搜索类任务
-        search_keywords = ["搜索", "查找", "search", "find", "查询"]
-        if any(kw in task_lower for kw in search_keywords):
-            return "search"
-        
-        # 代码类任务
-        code_keywords = ["代码", "编程", "code", "python", "javascript", "实现"]
-        if any(kw in task_lower for kw in code_keywords):
-            return "code"
-        
-        # 文件类任务
-        file_keywords = ["文件", "读取", "写入", "file", "read", "write", "保存"]
-        if any(kw in task_lower for kw in file_keywords):
-            return "files"
-        
-        # 浏览器类任务
-        browser_keywords = ["网页", "打开", "点击", "browser", "website", "url"]
-        if any(kw in task_lower for kw in browser_keywords):
-            return "browser"
-        
-        # 分析类任务
-        analysis_keywords = ["分析", "统计", "analysis", "数据", "报告"]
-        if any(kw in task_lower for kw in analysis_keywords):
-            return "analysis"
+        return self._classify_cached(task)
+    
+    @classmethod
+    @functools.lru_cache(maxsize=1024)
+    def _classify_cached(cls, task: str) -> str:
+        """按 (类, 任务文本) 缓存的分类结果，重复任务无需再次扫描"""
+        # 单次扫描：取命中类别中优先级最高的一个
+        # 分组按优先级编号（1 起），lastindex 即类别编号，无需按组名查表
+        best = None
+        for match in cls._task_pattern.finditer(task.lower()):
+            group = match.lastindex
+            if best is None or group < best:
+                best = group
+                if best == 1:
+                    break
+        return cls._task_categories[best] if best is not None else "general"
+    
+    @classmethod
+    def prepare_batch(cls, tasks: list[str]) -> None:
+        """
+        并行分派前一次性完成整批任务的分类并预热缓存
         
-        return "general"
+        重复的任务只扫描一次，各 Agent 执行时直接命中分类缓存
+        """
+        for task in dict.fromkeys(tasks):
+            cls._classify_cached(task)
     
     def _handle_search(self, task: str) -> str:
         """处理搜索任务 - 调用 OpenClaw 的搜索能力"""
@@ -143,6 +176,12 @@ class OpenClawAgent(Agent):
         return self._do_task(context)
 
 
+OpenClawAgent._build_task_classifier()
+
+# 同时包含“研究”和“写”（顺序不限）的任务
+_RESEARCH_AND_WRITE = re.compile(r"研究.*写|写.*研究", re.DOTALL)
+
+
 class OpenClawOrchestratorAgent(OpenClawAgent):
     """
     OpenClaw 作为编排器 Agent
@@ -151,6 +190,14 @@ class OpenClawOrchestratorAgent(OpenClawAgent):
     负责理解用户意图、分配任务、整合结果。
     """
     
+    __slots__ = ("sub_agents",)
+    
+    # 所有编排器实例共享的子任务分派线程池
+    _dispatch_pool = concurrent.futures.ThreadPoolExecutor(
+        max_workers=8,
+        thread_name_prefix="openclaw-dispatch",
+    )
+    
     def __init__(self, **kwargs):
         super().__init__(
             name="OpenClaw",
@@ -162,7 +209,7 @@ class OpenClawOrchestratorAgent(OpenClawAgent):
     def register_sub_agent(self, agent: Agent):
         """注册子 Agent"""
         self.sub_agents[agent.name] = agent
-        print(f"[OpenClaw] 已注册子 Agent: {agent.name} ({agent.role})")
+        logger.debug("[OpenClaw] 已注册子 Agent: %s (%s)", agent.name, agent.role)
     
     def _do_task(self, task: str, **kwargs) -> str:
         """
@@ -178,11 +225,16 @@ class OpenClawOrchestratorAgent(OpenClawAgent):
         strategy = self._plan_execution(task)
         
         if strategy["use_sub_agents"]:
-            # 需要子 Agent 协作
-            results = {}
-            for agent_name, sub_task in strategy["assignments"].items():
-                if agent_name in self.sub_agents:
-                    results[agent_name] = self.sub_agents[agent_name].execute_task(sub_task)
+            # 需要子 Agent 协作：子任务之间没有数据依赖，并发分派
+            futures = {
+                agent_name: self._dispatch_pool.submit(self.sub_agents[agent_name].execute_task, sub_task)
+                for agent_name, sub_task in strategy["assignments"].items()
+                if agent_name in self.sub_agents
+            }
+            results = {
+                agent_name: future.result()
+                for agent_name, future in futures.items()
+            }
             
             # 整合结果
             return self._integrate_results(task, results)
@@ -198,11 +250,8 @@ class OpenClawOrchestratorAgent(OpenClawAgent):
         - 是否需要多个 Agent 协作
         - 每个_agent 应该做什么
         """
-        # 简单的任务分类逻辑
-        task_lower = task.lower()
-        
         # 复杂任务示例：研究和写作
-        if "研究" in task and "写" in task:
+        if _RESEARCH_AND_WRITE.search(task):
             return {
                 "use_sub_agents": True,
                 "assignments": {
@@ -2,16 +2,29 @@
 Agent 基类 - 定义智能代理的核心接口
 """
 
-from typing import Optional, Callable, Any, List
+from typing import Optional, Callable, Any, List, Deque, AsyncIterator, Hashable, Tuple
+from collections import deque
 from dataclasses import dataclass, field
 from enum import Enum
-import uuid
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import logging
 import time
 
-from .message import Message, MessageBus
+from .message import Message, MessageBus, new_id
 from .memory import Memory
 from .tools import ToolRegistry
 
+logger = logging.getLogger(__name__)
+
+# 同步 Agent 在异步路径上使用的线程池，由 Orchestrator.run_dag 为每次调用单独设置；
+# 未设置时使用事件循环的默认线程池。按调用隔离，嵌套编排不会占满外层的线程
+_task_executor: contextvars.ContextVar[Optional[concurrent.futures.Executor]] = contextvars.ContextVar(
+    "agent_task_executor", default=None
+)
+
 
 class AgentState(Enum):
     """Agent 状态"""
@@ -45,6 +58,15 @@ class Agent:
     - 通信能力
     """
     
+    # 固定实例属性，省去每个实例的 __dict__；未声明 __slots__ 的子类仍可自由添加属性
+    __slots__ = (
+        "id", "name", "role", "description", "message_bus",
+        "_state", "_state_listeners", "memory", "tools", "inbox", "config",
+    )
+    
+    # 任务是否为 CPU 密集型；为 True 时编排器的 auto 模式会在子进程中执行
+    cpu_bound: bool = False
+    
     def __init__(
         self,
         name: str,
@@ -53,15 +75,16 @@ class Agent:
         message_bus: Optional[MessageBus] = None,
         config: Optional[AgentConfig] = None,
     ):
-        self.id = str(uuid.uuid4())[:8]
+        self.id = new_id()
         self.name = name
         self.role = role
         self.description = description
         self.message_bus = message_bus
+        self._state_listeners: Tuple[Callable[["Agent", AgentState], None], ...] = ()
         self.state = AgentState.IDLE
         self.memory = Memory(agent_id=self.id)
         self.tools = ToolRegistry()
-        self.inbox: List[Message] = []
+        self.inbox: Deque[Message] = deque()
         
         # 配置
         self.config = config or AgentConfig(
@@ -74,11 +97,26 @@ class Agent:
         if self.message_bus:
             self.message_bus.register(self)
     
+    @property
+    def state(self) -> AgentState:
+        """当前状态"""
+        return self._state
+    
+    @state.setter
+    def state(self, value: AgentState) -> None:
+        self._state = value
+        for listener in self._state_listeners:
+            listener(self, value)
+    
+    def add_state_listener(self, listener: Callable[["Agent", AgentState], None]) -> None:
+        """注册状态变更回调，每次设置 state 时以 (agent, state) 调用"""
+        self._state_listeners += (listener,)
+    
     def receive(self, message: Message) -> None:
         """接收消息"""
         self.inbox.append(message)
         self.memory.add_message(message)
-        print(f"[{self.name}] 收到来自 {message.sender} 的消息")
+        logger.debug("[%s] 收到来自 %s 的消息", self.name, message.sender)
     
     def send_to(self, target: str, content: Any, msg_type: str = "text") -> bool:
         """发送消息给指定 Agent"""
@@ -112,7 +150,7 @@ class Agent:
         """处理收件箱中的消息"""
         processed = []
         while self.inbox:
-            msg = self.inbox.pop(0)
+            msg = self.inbox.popleft()
             response = self.handle_message(msg)
             processed.append(msg)
             if response:
@@ -140,10 +178,77 @@ class Agent:
             self.state = AgentState.ERROR
             raise e
     
+    async def a_execute_task(self, task: str, **kwargs) -> Any:
+        """
+        异步执行任务
+        供编排器在事件循环中并发调度，语义与 execute_task 一致
+        """
+        self.state = AgentState.WORKING
+        try:
+            result = await self._a_do_task(task, **kwargs)
+            self.state = AgentState.IDLE
+            return result
+        except Exception as e:
+            self.state = AgentState.ERROR
+            raise e
+    
+    async def a_stream_task(self, task: str, **kwargs) -> AsyncIterator[Any]:
+        """
+        流式执行任务，逐段产出结果
+        默认实现在任务完成后一次性产出完整结果；支持流式输出的子类应重写此方法
+        """
+        yield await self.a_execute_task(task, **kwargs)
+    
+    def batch_key(self, task: str) -> Optional[Hashable]:
+        """
+        返回合并执行的分组键
+        键相同的 Agent 执行同一任务时可由 a_execute_batch 合并为一次调用；None 表示不合并
+        """
+        return None
+    
+    @classmethod
+    async def a_execute_batch(cls, agents: List["Agent"], task: str) -> List[Any]:
+        """合并执行一组 batch_key 相同的 Agent 的同一任务，默认逐个并发执行"""
+        return list(await asyncio.gather(*(agent.a_execute_task(task) for agent in agents)))
+    
+    @classmethod
+    def prepare_batch(cls, tasks: List[str]) -> None:
+        """
+        对即将并行分派给该类 Agent 的一批任务做一次性预处理（如预先分类）
+        由编排器在 run_parallel 分派前按 Agent 类型各调用一次；默认不做任何事
+        """
+    
     def _do_task(self, task: str, **kwargs) -> Any:
         """实际执行任务的内部方法"""
         raise NotImplementedError("子类需要实现 _do_task 方法")
     
+    async def _a_do_task(self, task: str, **kwargs) -> Any:
+        """
+        异步执行任务的内部方法
+        默认在当前编排设置的线程池中运行同步的 _do_task；原生异步的子类（如 LLMAgent）应重写此方法
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _task_executor.get(), functools.partial(self._do_task, task, **kwargs)
+        )
+    
+    def __getstate__(self) -> dict:
+        """序列化时不携带消息总线（它引用了所有其它 Agent）和状态回调，用于进程池执行"""
+        state = {
+            slot: getattr(self, slot)
+            for klass in type(self).__mro__
+            for slot in getattr(klass, "__slots__", ())
+            if hasattr(self, slot)
+        }
+        state.update(getattr(self, "__dict__", {}))
+        state["message_bus"] = None
+        state["_state_listeners"] = ()
+        return state
+    
+    def __setstate__(self, state: dict) -> None:
+        for attr, value in state.items():
+            object.__setattr__(self, attr, value)
+    
     def register_tool(self, name: str, func: Callable, description: str = "") -> None:
         """注册工具"""
         self.tools.register(name, func, description)
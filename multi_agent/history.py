@@ -0,0 +1,83 @@
+"""
+历史记录 - 有容量上限、可按键查询的历史
+"""
+
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence
+from collections import deque
+
+
+class HistoryView(Sequence):
+    """
+    deque 的只读视图
+
+    支持长度、下标、切片和迭代，不提供任何修改方法；底层 deque 的变化会实时反映出来。
+    对外暴露内部记录时使用它，记录只能经由所属对象的方法修改，其维护的索引不会失效
+    """
+
+    __slots__ = ("_records",)
+
+    def __init__(self, records: Deque[Any]):
+        self._records = records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self._records)[index]
+        return self._records[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._records)
+
+    def __reversed__(self) -> Iterator[Any]:
+        return reversed(self._records)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self._records)!r})"
+
+
+class KeyedHistory:
+    """
+    按时间顺序保存的历史记录，并为每个键维护一份索引
+
+    每条记录可以关联多个键（如消息的发送方和接收方），get(key) 直接返回该键的记录，
+    无需扫描全部历史。超出容量时丢弃最旧的记录，索引同步淘汰；
+    records 是只读视图，记录只能经由 append/clear 修改，索引始终与之一致
+
+    Args:
+        cap: 最多保留的记录条数；None 表示不限制
+        keys_of: 返回一条记录所关联的键（不重复）
+    """
+
+    def __init__(self, cap: Optional[int], keys_of: Callable[[Any], Iterable[Hashable]]):
+        self._records: Deque[Any] = deque(maxlen=cap)
+        self.records = HistoryView(self._records)
+        self._keys_of = keys_of
+        self._by_key: Dict[Hashable, Deque[Any]] = {}
+
+    def append(self, record: Any) -> None:
+        """追加一条记录"""
+        if self._records.maxlen == 0:
+            return
+        if len(self._records) == self._records.maxlen:
+            # 被挤出的是最旧的记录，也位于其各个键索引的最左端
+            evicted = self._records[0]
+            for key in self._keys_of(evicted):
+                bucket = self._by_key.get(key)
+                if bucket:
+                    bucket.popleft()
+                    if not bucket:
+                        del self._by_key[key]
+        self._records.append(record)
+        for key in self._keys_of(record):
+            self._by_key.setdefault(key, deque()).append(record)
+
+    def get(self, key: Hashable) -> List[Any]:
+        """获取与 key 关联的记录"""
+        return list(self._by_key.get(key, ()))
+
+    def clear(self) -> None:
+        """清空历史"""
+        self._records.clear()
+        self._by_key.clear()
@@ -4,20 +4,28 @@ LLM Agent 实现 - 接入真实的 LLM API
 
 import os
 import json
-from typing import Any, Optional, Callable, List, Dict
+import asyncio
+import functools
+import importlib.util
+import threading
+import concurrent.futures
+from collections import deque
+from typing import Any, Optional, Callable, List, Dict, Deque, Coroutine, AsyncIterator
 from dataclasses import dataclass
 
-try:
-    from openai import OpenAI
-    HAS_OPENAI = True
-except ImportError:
-    HAS_OPENAI = False
+# openai / anthropic / httpx 导入开销较大，只检查是否安装，真正创建客户端时再导入
+HAS_OPENAI = importlib.util.find_spec("openai") is not None
+HAS_ANTHROPIC = importlib.util.find_spec("anthropic") is not None
+HAS_HTTPX = importlib.util.find_spec("httpx") is not None
 
 try:
-    import anthropic
-    HAS_ANTHROPIC = True
+    import orjson
+    _json_loads = orjson.loads
 except ImportError:
-    HAS_ANTHROPIC = False
+    _json_loads = json.loads
+
+# httpx 的 HTTP/2 支持依赖可选的 h2 包
+HAS_HTTP2 = importlib.util.find_spec("h2") is not None
 
 from .agent import Agent, AgentConfig, AgentState
 from .message import Message
@@ -32,6 +40,74 @@ class LLMAgentConfig(AgentConfig):
     system_prompt: str = ""
 
 
+# 所有异步 LLM 客户端都运行在同一个后台事件循环上，
+# 这样 httpx 连接池可以跨 Agent、跨多次 asyncio.run 复用
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_client_loop_thread: Optional[threading.Thread] = None
+_client_loop_lock = threading.Lock()
+
+
+def _get_client_loop() -> asyncio.AbstractEventLoop:
+    """获取（必要时启动）承载 LLM 客户端的后台事件循环"""
+    global _client_loop, _client_loop_thread
+    with _client_loop_lock:
+        if _client_loop is None:
+            _client_loop = asyncio.new_event_loop()
+            _client_loop_thread = threading.Thread(
+                target=_client_loop.run_forever,
+                name="llm-client-loop",
+                daemon=True,
+            )
+            _client_loop_thread.start()
+        return _client_loop
+
+
+def _reset_client_loop() -> None:
+    """fork 后子进程中没有后台线程，丢弃继承来的事件循环和客户端"""
+    global _client_loop, _client_loop_thread, _client_loop_lock
+    _client_loop = None
+    _client_loop_thread = None
+    _client_loop_lock = threading.Lock()
+    _get_async_client.cache_clear()
+
+
+def _run_on_client_loop(coro: Coroutine) -> concurrent.futures.Future:
+    """将协程提交到后台事件循环执行"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_client_loop())
+
+
+# 流式输出结束的哨兵
+_STREAM_END = object()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_async_client(provider: str, api_key: Optional[str], base_url: Optional[str]) -> Any:
+    """
+    按 (provider, api_key, base_url) 缓存异步客户端
+    
+    同一端点的所有 Agent 共享一个 httpx 连接池，避免重复的 TLS 握手
+    """
+    client_kwargs: Dict[str, Any] = {"api_key": api_key}
+    if base_url:
+        client_kwargs["base_url"] = base_url
+    if HAS_HTTPX:
+        import httpx
+        client_kwargs["http_client"] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            http2=HAS_HTTP2,
+        )
+    
+    if provider == "anthropic":
+        import anthropic
+        return anthropic.AsyncAnthropic(**client_kwargs)
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(**client_kwargs)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_client_loop)
+
+
 class LLMAgent(Agent):
     """
     LLM Agent - 连接真实的大语言模型
@@ -42,6 +118,14 @@ class LLMAgent(Agent):
     - 自定义 API 端点
     """
     
+    __slots__ = (
+        "model", "api_key", "base_url", "system_prompt",
+        "_client", "_provider", "conversation_history",
+    )
+    
+    # 对话历史保留的消息条数（每轮 2 条）
+    MAX_HISTORY_MESSAGES = 20
+    
     def __init__(
         self,
         name: str,
@@ -63,25 +147,46 @@ class LLMAgent(Agent):
         self._client = None
         self._init_client()
         
-        # 对话历史
-        self.conversation_history: List[Dict] = []
+        # 对话历史（环形缓冲，只保留最近 10 轮）
+        self.conversation_history: Deque[Dict] = deque(maxlen=self.MAX_HISTORY_MESSAGES)
     
     def _init_client(self):
         """初始化 LLM 客户端"""
+        self._provider = None
         if "claude" in self.model.lower():
             if HAS_ANTHROPIC and self.api_key:
-                self._client = anthropic.Anthropic(api_key=self.api_key)
+                self._client = _get_async_client("anthropic", self.api_key, self.base_url)
                 self._provider = "anthropic"
         else:
             if HAS_OPENAI:
-                client_kwargs = {"api_key": self.api_key}
-                if self.base_url:
-                    client_kwargs["base_url"] = self.base_url
-                self._client = OpenAI(**client_kwargs)
+                self._client = _get_async_client("openai", self.api_key, self.base_url)
                 self._provider = "openai"
     
+    def __getstate__(self) -> dict:
+        """客户端不可 pickle，反序列化时按配置重建"""
+        state = super().__getstate__()
+        state["_client"] = None
+        return state
+    
+    def __setstate__(self, state: dict) -> None:
+        super().__setstate__(state)
+        self._init_client()
+    
     def _do_task(self, task: str, **kwargs) -> str:
-        """执行任务 - 调用 LLM"""
+        """执行任务 - 同步调用 LLM（在后台事件循环上等待异步请求完成）"""
+        if threading.current_thread() is _client_loop_thread:
+            raise RuntimeError("不能在 LLM 客户端事件循环内同步调用 _do_task")
+        return _run_on_client_loop(self._a_call_llm(task, **kwargs)).result()
+    
+    async def _a_do_task(self, task: str, **kwargs) -> str:
+        """执行任务 - 异步调用 LLM"""
+        # 子类只重写了同步 _do_task 时，保留其自定义逻辑
+        if type(self)._do_task is not LLMAgent._do_task:
+            return await super()._a_do_task(task, **kwargs)
+        return await asyncio.wrap_future(_run_on_client_loop(self._a_call_llm(task, **kwargs)))
+    
+    async def _a_call_llm(self, task: str, **kwargs) -> str:
+        """调用 LLM，必须运行在后台客户端事件循环上"""
         if not self._client:
             return f"[{self.name}] 错误：LLM 客户端未初始化"
         
@@ -90,7 +195,7 @@ class LLMAgent(Agent):
         
         try:
             if self._provider == "anthropic":
-                response = self._client.messages.create(
+                response = await self._client.messages.create(
                     model=self.model,
                     max_tokens=4096,
                     system=self.system_prompt,
@@ -98,7 +203,7 @@ class LLMAgent(Agent):
                 )
                 result = response.content[0].text
             else:
-                response = self._client.chat.completions.create(
+                response = await self._client.chat.completions.create(
                     model=self.model,
                     messages=messages,
                 )
@@ -113,18 +218,135 @@ class LLMAgent(Agent):
         except Exception as e:
             return f"[{self.name}] 调用 LLM 失败: {e}"
     
-    def _build_messages(self, user_input: str) -> List[Dict]:
-        """构建消息列表"""
-        messages = []
+    def batch_key(self, task: str) -> Optional[tuple]:
+        """同一客户端、模型、系统提示和完整消息列表的请求可以合并"""
+        if self._provider != "openai" or not self._client:
+            return None
+        # 自定义了请求逻辑的子类不参与合并
+        if type(self)._do_task is not LLMAgent._do_task or type(self)._a_call_llm is not LLMAgent._a_call_llm:
+            return None
+        messages = tuple((m["role"], m["content"]) for m in self._build_messages(task))
+        return (id(self._client), self.model, self.system_prompt, messages)
+    
+    @classmethod
+    async def a_execute_batch(cls, agents: List["LLMAgent"], task: str) -> List[str]:
+        """用一次 n=len(agents) 的请求为一组 Agent 生成结果，共享提示词的预填充"""
+        if len(agents) == 1:
+            return [await agents[0].a_execute_task(task)]
+        
+        for agent in agents:
+            agent.state = AgentState.WORKING
+        try:
+            leader = agents[0]
+            return await asyncio.wrap_future(
+                _run_on_client_loop(leader._a_call_llm_shared(task, agents))
+            )
+        finally:
+            for agent in agents:
+                agent.state = AgentState.IDLE
+    
+    async def _a_call_llm_shared(self, task: str, agents: List["LLMAgent"]) -> List[str]:
+        """以自身的消息列表发起一次多候选请求，结果按顺序分给各 Agent"""
+        messages = self._build_messages(task)
+        
+        try:
+            response = await self._client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                n=len(agents),
+            )
+            choices = sorted(response.choices, key=lambda choice: choice.index)
+            results = [choice.message.content for choice in choices]
+        except Exception as e:
+            return [f"[{agent.name}] 调用 LLM 失败: {e}" for agent in agents]
+        
+        for agent, result in zip(agents, results):
+            agent.conversation_history.append({"role": "user", "content": task})
+            agent.conversation_history.append({"role": "assistant", "content": result})
+        return results
+    
+    async def a_stream_task(self, task: str, **kwargs) -> AsyncIterator[str]:
+        """
+        流式执行任务，LLM 输出到达即产出
         
-        # 添加历史对话（保留最近 10 轮）
-        for msg in self.conversation_history[-20:]:
-            messages.append(msg)
+        请求在后台客户端事件循环上进行，文本片段经队列转交给调用方的事件循环；
+        完整回复只在流结束后写入对话历史
+        """
+        if not self._client:
+            yield f"[{self.name}] 错误：LLM 客户端未初始化"
+            return
         
-        # 添加当前输入
-        messages.append({"role": "user", "content": user_input})
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = _run_on_client_loop(
+            self._a_stream_llm(task, asyncio.get_running_loop(), queue)
+        )
+        self.state = AgentState.WORKING
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is _STREAM_END:
+                    break
+                yield chunk
+        finally:
+            # 调用方提前退出时停止后台请求
+            producer.cancel()
+            self.state = AgentState.IDLE
+    
+    async def _a_stream_llm(
+        self,
+        task: str,
+        loop: asyncio.AbstractEventLoop,
+        queue: asyncio.Queue,
+    ) -> None:
+        """流式调用 LLM，必须运行在后台客户端事件循环上"""
+        def emit(item: Any) -> None:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
         
-        return messages
+        messages = self._build_messages(task)
+        parts: List[str] = []
+        
+        try:
+            if self._provider == "anthropic":
+                stream = await self._client.messages.create(
+                    model=self.model,
+                    max_tokens=4096,
+                    system=self.system_prompt,
+                    messages=messages,
+                    stream=True,
+                )
+                async for event in stream:
+                    if getattr(event, "type", None) != "content_block_delta":
+                        continue
+                    text = getattr(event.delta, "text", "")
+                    if text:
+                        parts.append(text)
+                        emit(text)
+            else:
+                stream = await self._client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content or ""
+                    if text:
+                        parts.append(text)
+                        emit(text)
+            
+            # 保存到对话历史
+            self.conversation_history.append({"role": "user", "content": task})
+            self.conversation_history.append({"role": "assistant", "content": "".join(parts)})
+            
+        except Exception as e:
+            emit(f"[{self.name}] 调用 LLM 失败: {e}")
+        finally:
+            emit(_STREAM_END)
+    
+    def _build_messages(self, user_input: str) -> List[Dict]:
+        """构建消息列表：历史对话 + 当前输入，一次性按最终长度构建"""
+        return [*self.conversation_history, {"role": "user", "content": user_input}]
     
     def handle_message(self, message: Message) -> str:
         """处理收到的消息"""
@@ -148,10 +370,17 @@ class ToolEnabledAgent(LLMAgent):
     可以调用注册的工具来完成任务
     """
     
-    def _do_task(self, task: str, **kwargs) -> str:
-        """执行任务 - 支持工具调用"""
+    __slots__ = ()
+    
+    async def _a_call_llm(self, task: str, **kwargs) -> str:
+        """
+        调用 LLM - 支持工具调用
+        
+        首次请求以流式方式读取，某个工具调用的参数一旦完整就立即开始执行，
+        不必等待整个响应结束
+        """
         if not self._client or self._provider != "openai":
-            return super()._do_task(task)
+            return await super()._a_call_llm(task)
         
         messages = self._build_messages(task)
         
@@ -159,47 +388,86 @@ class ToolEnabledAgent(LLMAgent):
         tools = self.tools.to_openai_tools() if self.tools.tools else None
         
         try:
-            response = self._client.chat.completions.create(
+            stream = await self._client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 tools=tools if tools else None,
                 tool_choice="auto" if tools else None,
+                stream=True,
             )
             
-            message = response.choices[0].message
+            content_parts: List[str] = []
+            tool_calls: List[Dict[str, Any]] = []
+            running: List[asyncio.Task] = []
             
-            # 检查是否需要调用工具
-            if message.tool_calls:
-                # 执行工具调用
-                tool_results = []
-                for tool_call in message.tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
-                    
-                    # 执行工具
-                    result = self.tools.execute(tool_name, **tool_args)
-                    tool_results.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": tool_name,
-                        "content": str(result),
-                    })
-                
-                # 将工具结果发回 LLM
-                messages.append(message)
-                messages.extend(tool_results)
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
                 
-                # 获取最终响应
-                final_response = self._client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                )
-                return final_response.choices[0].message.content
+                for call_delta in delta.tool_calls or []:
+                    # 工具调用按 index 顺序输出，出现新 index 说明之前的调用参数已完整
+                    while len(tool_calls) <= call_delta.index:
+                        tool_calls.append({"id": None, "name": "", "arguments": ""})
+                    while len(running) < call_delta.index:
+                        running.append(self._start_tool_call(tool_calls[len(running)]))
+                    
+                    call = tool_calls[call_delta.index]
+                    if call_delta.id:
+                        call["id"] = call_delta.id
+                    if call_delta.function:
+                        call["name"] += call_delta.function.name or ""
+                        call["arguments"] += call_delta.function.arguments or ""
+            
+            # 检查是否需要调用工具
+            if not tool_calls:
+                return "".join(content_parts)
+            
+            while len(running) < len(tool_calls):
+                running.append(self._start_tool_call(tool_calls[len(running)]))
+            tool_outputs = await asyncio.gather(*running)
             
-            return message.content
+            # 将工具结果发回 LLM
+            messages.append({
+                "role": "assistant",
+                "content": "".join(content_parts) or None,
+                "tool_calls": [
+                    {
+                        "id": call["id"],
+                        "type": "function",
+                        "function": {"name": call["name"], "arguments": call["arguments"]},
+                    }
+                    for call in tool_calls
+                ],
+            })
+            messages.extend(
+                {
+                    "tool_call_id": call["id"],
+                    "role": "tool",
+                    "name": call["name"],
+                    "content": str(result),
+                }
+                for call, result in zip(tool_calls, tool_outputs)
+            )
+            
+            # 获取最终响应
+            final_response = await self._client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+            )
+            return final_response.choices[0].message.content
             
         except Exception as e:
             return f"[{self.name}] 执行失败: {e}"
+    
+    def _start_tool_call(self, call: Dict[str, Any]) -> asyncio.Task:
+        """在线程中开始执行一个参数已完整的工具调用"""
+        async def run() -> Any:
+            args = _json_loads(call["arguments"] or "{}")
+            return await asyncio.to_thread(self.tools.execute, call["name"], **args)
+        return asyncio.create_task(run())
 
 
 # 预定义的专家 Agent 模板
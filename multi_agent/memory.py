@@ -2,37 +2,90 @@
 记忆系统 - Agent 的记忆和状态管理
 """
 
-from typing import Any, Optional, List, Dict
-from dataclasses import dataclass, field
+from typing import Any, Optional, List, Dict, Set, FrozenSet, Iterable, Iterator, Deque, Sequence, Tuple
+from dataclasses import field
+from collections import deque
+import functools
+import itertools
 from datetime import datetime
 import json
 
+from .history import HistoryView, KeyedHistory
+from .message import encode_json, slotted_dataclass
 
-@dataclass
+
+@slotted_dataclass
 class MemoryEntry:
     """记忆条目"""
     content: Any
     entry_type: str = "general"  # general, message, task, observation
     timestamp: datetime = field(default_factory=datetime.now)
     metadata: Dict = field(default_factory=dict)
+    _seq: int = field(default=-1, init=False, repr=False, compare=False)  # 在所属 Memory 中的插入序号
+    # 小写的可搜索文本，建立搜索索引时计算一次，之后的搜索无需重复 lower()
+    _text_lc: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+
+# 倒排索引的 n-gram 长度；任何长度 >= _NGRAM 的子串都包含其全部 n-gram
+_NGRAM = 2
+
+
+def _searchable_text(content: Any) -> Optional[str]:
+    """提取可搜索的小写文本；不可搜索的内容返回 None"""
+    if isinstance(content, str):
+        return content.lower()
+    if hasattr(content, 'content'):
+        return str(content.content).lower()
+    return None
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i:i + _NGRAM] for i in range(len(text) - _NGRAM + 1)}
+
+
+@functools.lru_cache(maxsize=4096)
+def _query_grams(query: str) -> Tuple[str, FrozenSet[str]]:
+    """小写化查询并切分 n-gram；Agent 循环中的重复查询直接命中缓存"""
+    query = query.lower()
+    return query, frozenset(_ngrams(query))
 
 
 class Memory:
     """
     Agent 记忆系统
     
-    支持短期记忆和长期记忆
+    支持短期记忆和长期记忆；short_term、long_term 为只读视图，记忆只能经由 add 等方法修改
+    
+    Args:
+        agent_id: 所属 Agent 的 ID
+        max_short_term: 短期记忆容量，超出后最旧的条目移入长期记忆
+        max_long_term: 长期记忆容量，超出后丢弃最旧的条目；None 表示不限制
     """
     
-    def __init__(self, agent_id: str, max_short_term: int = 100):
+    def __init__(
+        self,
+        agent_id: str,
+        max_short_term: int = 100,
+        max_long_term: Optional[int] = 10_000,
+    ):
         self.agent_id = agent_id
         self.max_short_term = max_short_term
+        self.max_long_term = max_long_term
         
         # 短期记忆（最近的活动）
-        self.short_term: List[MemoryEntry] = []
+        self._short_term: Deque[MemoryEntry] = deque(maxlen=max_short_term)
+        self.short_term = HistoryView(self._short_term)
         
         # 长期记忆（重要信息）
-        self.long_term: List[MemoryEntry] = []
+        self._long_term: Deque[MemoryEntry] = deque(maxlen=max_long_term)
+        self.long_term = HistoryView(self._long_term)
+        
+        # 搜索用的字符 n-gram 倒排索引：n-gram -> 条目序号集合
+        # 首次 search 时才建立，之后随增删增量维护；从不搜索的记忆不承担索引开销
+        self._indexed = False
+        self._inverted: Dict[str, Set[int]] = {}
+        self._entries: Dict[int, MemoryEntry] = {}
+        self._next_seq = 0
     
     def add(self, content: Any, entry_type: str = "general", **metadata) -> None:
         """添加记忆"""
@@ -41,13 +94,26 @@ class Memory:
             entry_type=entry_type,
             metadata=metadata,
         )
-        self.short_term.append(entry)
+        entry._seq = self._next_seq
+        self._next_seq += 1
+        if self._indexed:
+            self._index(entry)
         
-        # 限制短期记忆大小
-        if len(self.short_term) > self.max_short_term:
-            # 将最旧的移入长期记忆
-            oldest = self.short_term.pop(0)
-            self.long_term.append(oldest)
+        if self._short_term.maxlen == 0:
+            # 不保留短期记忆，直接写入长期记忆
+            self._to_long_term(entry)
+            return
+        # 短期记忆已满时，append 会挤出最旧的条目，先将其移入长期记忆
+        if len(self._short_term) == self._short_term.maxlen:
+            self._to_long_term(self._short_term[0])
+        self._short_term.append(entry)
+    
+    def _to_long_term(self, entry: MemoryEntry) -> None:
+        """将条目写入长期记忆，长期记忆已满时丢弃最旧的条目"""
+        if len(self._long_term) == self._long_term.maxlen and self._indexed:
+            # 被丢弃的是最旧的条目；容量为 0 时即 entry 本身
+            self._unindex(self._long_term[0] if self._long_term else entry)
+        self._long_term.append(entry)
     
     def add_message(self, message: Any) -> None:
         """添加消息到记忆"""
@@ -65,37 +131,108 @@ class Memory:
     
     def get_recent(self, n: int = 10) -> List[MemoryEntry]:
         """获取最近的记忆"""
-        return self.short_term[-n:]
+        return list(itertools.islice(self._short_term, max(0, len(self._short_term) - n), None))
     
     def search(self, query: str) -> List[MemoryEntry]:
-        """搜索记忆（简单字符串匹配）"""
-        results = []
-        for entry in self.short_term + self.long_term:
-            if isinstance(entry.content, str) and query.lower() in entry.content.lower():
-                results.append(entry)
-            elif hasattr(entry.content, 'content'):
-                if query.lower() in str(entry.content.content).lower():
-                    results.append(entry)
-        return results
+        """
+        搜索记忆（不区分大小写的子串匹配）
+        
+        先用查询的 n-gram 在倒排索引中求交集缩小候选，再逐个验证子串；
+        结果顺序与直接扫描 short_term + long_term 一致。索引在首次搜索时建立
+        """
+        if not self._indexed:
+            self._rebuild_index()
+        
+        query, grams = _query_grams(query)
+        if grams:
+            postings = sorted((self._inverted.get(g, set()) for g in grams), key=len)
+            candidates: Iterable[int] = set.intersection(*postings)
+        else:
+            candidates = self._entries.keys()
+        
+        matched = sorted(
+            seq for seq in candidates
+            if self._entries[seq]._text_lc is not None and query in self._entries[seq]._text_lc
+        )
+        
+        # 短期记忆中的条目序号都大于长期记忆中的，排在前面
+        short_start = self._short_term[0]._seq if self._short_term else self._next_seq
+        return [
+            self._entries[seq]
+            for seq in matched if seq >= short_start
+        ] + [
+            self._entries[seq]
+            for seq in matched if seq < short_start
+        ]
     
     def clear_short_term(self) -> None:
         """清空短期记忆"""
-        self.short_term.clear()
+        if self._indexed:
+            for entry in self._short_term:
+                self._unindex(entry)
+        self._short_term.clear()
+    
+    def _index(self, entry: MemoryEntry) -> None:
+        """将条目加入倒排索引"""
+        entry._text_lc = _searchable_text(entry.content)
+        self._entries[entry._seq] = entry
+        if entry._text_lc is None:
+            return
+        for gram in _ngrams(entry._text_lc):
+            self._inverted.setdefault(gram, set()).add(entry._seq)
+    
+    def _unindex(self, entry: MemoryEntry) -> None:
+        """将条目移出倒排索引"""
+        self._entries.pop(entry._seq, None)
+        if entry._text_lc is None:
+            return
+        for gram in _ngrams(entry._text_lc):
+            posting = self._inverted.get(gram)
+            if posting is not None:
+                posting.discard(entry._seq)
+                if not posting:
+                    del self._inverted[gram]
+    
+    def _rebuild_index(self) -> None:
+        """按 long_term、short_term 的顺序重新编号并重建索引"""
+        self._inverted.clear()
+        self._entries.clear()
+        self._next_seq = 0
+        for entry in itertools.chain(self._long_term, self._short_term):
+            entry._seq = self._next_seq
+            self._next_seq += 1
+            self._index(entry)
+        self._indexed = True
     
     def to_dict(self) -> Dict:
         """导出为字典"""
         return {
             "agent_id": self.agent_id,
-            "short_term": [
-                {
-                    "content": str(e.content),
-                    "type": e.entry_type,
-                    "timestamp": e.timestamp.isoformat(),
-                }
-                for e in self.short_term
-            ],
-            "long_term_count": len(self.long_term),
+            "short_term": [self._export_entry(e) for e in self._short_term],
+            "long_term_count": len(self._long_term),
         }
+    
+    def iter_encoded(self) -> Iterator[bytes]:
+        """
+        逐条导出短期记忆为 JSON 字节串（格式同 to_dict 中的 short_term 条目）
+        
+        只对条目引用做快照，不预先构建整份字典列表，适合流式输出
+        """
+        for entry in list(self._short_term):
+            yield encode_json(self._export_entry(entry))
+    
+    @staticmethod
+    def _export_entry(entry: MemoryEntry) -> Dict:
+        return {
+            "content": str(entry.content),
+            "type": entry.entry_type,
+            "timestamp": entry.timestamp.isoformat(),
+        }
+
+
+def _record_key(record: tuple) -> Tuple[str]:
+    """共享记忆变更历史的索引键"""
+    return (record[0],)
 
 
 class SharedMemory:
@@ -103,16 +240,25 @@ class SharedMemory:
     共享记忆
     
     用于多个 Agent 之间共享状态和信息
+    
+    Args:
+        history_cap: 变更历史保留的最大条数，超出后丢弃最旧的记录；None 表示不限制
     """
     
-    def __init__(self):
+    def __init__(self, history_cap: Optional[int] = 50_000):
         self.data: Dict[str, Any] = {}
-        self.history: List[tuple] = []
+        # 变更历史 (key, value, time) 及按键的索引
+        self._history = KeyedHistory(history_cap, _record_key)
+    
+    @property
+    def history(self) -> Sequence[tuple]:
+        """按时间顺序的变更历史（只读视图，清空请用 clear_history）"""
+        return self._history.records
     
     def set(self, key: str, value: Any) -> None:
         """设置共享数据"""
         self.data[key] = value
-        self.history.append((key, value, datetime.now()))
+        self._history.append((key, value, datetime.now()))
     
     def get(self, key: str, default: Any = None) -> Any:
         """获取共享数据"""
@@ -137,8 +283,12 @@ class SharedMemory:
     def get_history(self, key: Optional[str] = None) -> List:
         """获取历史记录"""
         if key:
-            return [(k, v, t) for k, v, t in self.history if k == key]
-        return self.history.copy()
+            return self._history.get(key)
+        return list(self.history)
+    
+    def clear_history(self) -> None:
+        """清空变更历史"""
+        self._history.clear()
     
     def to_dict(self) -> Dict:
         """导出为字典"""
@@ -2,13 +2,46 @@
 消息系统 - Agent 之间的通信机制
 """
 
-from typing import Any, Optional, List, Dict, Callable, List, Dict, Callable
+from typing import Any, Optional, List, Dict, Callable, Iterator, Set, Union
 from dataclasses import dataclass, field
 from datetime import datetime
-import uuid
+import functools
+import json
+import logging
+import os
+import sys
 
+from .history import HistoryView, KeyedHistory
 
-@dataclass
+try:
+    import msgspec
+    HAS_MSGSPEC = True
+except ImportError:
+    HAS_MSGSPEC = False
+
+logger = logging.getLogger(__name__)
+
+# 复用同一个编码器；无法编码的对象按 str() 输出，与 json.dumps(default=str) 一致
+_json_encoder = msgspec.json.Encoder(enc_hook=str) if HAS_MSGSPEC else None
+
+
+# 高频创建的数据类（消息、记忆条目、任务）使用 __slots__，Python 3.10 以下退化为普通 dataclass
+slotted_dataclass = functools.partial(dataclass, slots=True) if sys.version_info >= (3, 10) else dataclass
+
+
+def new_id() -> str:
+    """生成 8 位十六进制随机 ID（消息、任务、Agent 共用）"""
+    return os.urandom(4).hex()
+
+
+def encode_json(obj: Any) -> bytes:
+    """编码为 UTF-8 JSON 字节串，安装了 msgspec 时使用其编码器"""
+    if _json_encoder is not None:
+        return _json_encoder.encode(obj)
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+
+@slotted_dataclass
 class Message:
     """
     消息对象
@@ -20,7 +53,7 @@ class Message:
     content: Any
     msg_type: str = "text"  # text, task, result, control
     metadata: dict = field(default_factory=dict)
-    id: str = field(default_factory=lambda: str(uuid.uuid4())[:8])
+    id: str = field(default_factory=new_id)
     timestamp: datetime = field(default_factory=datetime.now)
     
     def to_dict(self) -> dict:
@@ -47,47 +80,96 @@ class Message:
         )
 
 
+if HAS_MSGSPEC:
+    class _MessageRecord(msgspec.Struct):
+        """Message.to_dict() 格式的解码结构，时间戳由 msgspec 在 C 层解析"""
+        sender: str
+        receiver: str
+        content: Any
+        timestamp: datetime
+        id: Optional[str] = None
+        type: str = "text"
+        metadata: dict = msgspec.field(default_factory=dict)
+    
+    _history_decoder = msgspec.json.Decoder(List[_MessageRecord])
+else:
+    _history_decoder = None
+
+
+def decode_messages(raw: Union[bytes, str]) -> List[Message]:
+    """解码 Message.to_dict() 组成的 JSON 数组，安装了 msgspec 时不经过中间字典"""
+    if _history_decoder is not None:
+        return [
+            Message(
+                id=r.id,
+                sender=r.sender,
+                receiver=r.receiver,
+                content=r.content,
+                msg_type=r.type,
+                metadata=r.metadata,
+                timestamp=r.timestamp,
+            )
+            for r in _history_decoder.decode(raw)
+        ]
+    return [Message.from_dict(data) for data in json.loads(raw)]
+
+
+def _message_parties(message: Message) -> Set[str]:
+    """消息历史的索引键：发送方和接收方"""
+    return {message.sender, message.receiver}
+
+
 class MessageBus:
     """
     消息总线
     
     负责 Agent 之间的消息路由
+    
+    Args:
+        history_cap: 消息历史保留的最大条数，超出后丢弃最旧的消息；None 表示不限制
     """
     
-    def __init__(self):
+    def __init__(self, history_cap: Optional[int] = 10_000):
         self.agents: Dict[str, "Agent"] = {}  # type: ignore
-        self.history: List[Message] = []
+        # 消息历史及按收发方的索引
+        self._history = KeyedHistory(history_cap, _message_parties)
         self.hooks: List[Callable] = []
     
+    @property
+    def history(self) -> HistoryView:
+        """按时间顺序的消息历史（只读视图，清空请用 clear_history）"""
+        return self._history.records
+    
     def register(self, agent: "Agent") -> None:  # type: ignore
         """注册 Agent"""
         self.agents[agent.name] = agent
-        print(f"[MessageBus] Agent '{agent.name}' 已注册")
+        logger.debug("[MessageBus] Agent '%s' 已注册", agent.name)
     
     def unregister(self, agent_name: str) -> None:
         """注销 Agent"""
         if agent_name in self.agents:
             del self.agents[agent_name]
-            print(f"[MessageBus] Agent '{agent_name}' 已注销")
+            logger.debug("[MessageBus] Agent '%s' 已注销", agent_name)
     
     def send(self, message: Message) -> bool:
         """发送消息给指定 Agent"""
-        self.history.append(message)
+        self._history.append(message)
         
         # 触发钩子
         for hook in self.hooks:
             hook(message)
         
-        if message.receiver in self.agents:
-            self.agents[message.receiver].receive(message)
+        receiver = self.agents.get(message.receiver)
+        if receiver is not None:
+            receiver.receive(message)
             return True
         
-        print(f"[MessageBus] 警告：未找到接收者 '{message.receiver}'")
+        logger.warning("[MessageBus] 未找到接收者 '%s'", message.receiver)
         return False
     
     def broadcast(self, message: Message) -> None:
         """广播消息给所有 Agent（除发送者外）"""
-        self.history.append(message)
+        self._history.append(message)
         
         for hook in self.hooks:
             hook(message)
@@ -103,15 +185,32 @@ class MessageBus:
     def get_history(self, agent_name: Optional[str] = None) -> List[Message]:
         """获取消息历史"""
         if agent_name:
-            return [
-                m for m in self.history 
-                if m.sender == agent_name or m.receiver == agent_name
-            ]
-        return self.history.copy()
+            return self._history.get(agent_name)
+        return list(self.history)
+    
+    def load_history(self, raw: Union[bytes, str]) -> int:
+        """
+        从 JSON 数组（如 /api/bus/history 导出的 history）回放消息历史
+        
+        消息只写入历史，不会投递给 Agent，也不触发钩子；返回载入的条数
+        """
+        messages = decode_messages(raw)
+        for message in messages:
+            self._history.append(message)
+        return len(messages)
+    
+    def iter_encoded(self, agent_name: Optional[str] = None) -> Iterator[bytes]:
+        """
+        逐条导出消息历史为 JSON 字节串（格式同 Message.to_dict）
+        
+        只对消息引用做快照，不预先构建整份字典列表，适合流式输出
+        """
+        for message in self.get_history(agent_name):
+            yield encode_json(message.to_dict())
     
     def clear_history(self) -> None:
         """清空消息历史"""
-        self.history.clear()
+        self._history.clear()
     
     def __repr__(self) -> str:
         return f"MessageBus(agents={list(self.agents.keys())})"
\ No newline at end of file
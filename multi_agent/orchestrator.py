@@ -2,13 +2,66 @@
 编排器 - 协调多个 Agent 完成复杂任务
 """
 
-from typing import Optional, List, Dict, Any
-from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Coroutine, Deque, Hashable, Iterable, Tuple
+from collections import deque
 from enum import Enum
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
 import time
 
-from .agent import Agent, AgentState
-from .message import MessageBus
+from .agent import Agent, AgentState, _task_executor
+from .message import MessageBus, new_id, slotted_dataclass
+
+logger = logging.getLogger(__name__)
+
+
+# 通知 DAG worker 退出的哨兵
+_STOP = object()
+
+# 并行执行方式
+PARALLEL_MODES = ("auto", "thread", "process")
+
+
+def _run_sync(coro: Coroutine[Any, Any, Any]) -> Any:
+    """
+    在同步代码中运行协程
+    
+    当前线程没有运行中的事件循环时直接 asyncio.run；否则（如在 Jupyter 或异步 Agent 中调用）
+    在辅助线程的新事件循环中运行并等待结果，避免 asyncio.run 报错
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="orchestrator-run") as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+# cpu_bound Agent 共用的进程池，首次使用时创建。使用 spawn 启动子进程：
+# fork 会复制调用时其它线程持有的锁（如 Agent 线程池中的 logging 锁），可能导致子进程死锁
+_process_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """获取共用的进程池"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+def _execute_task_in_process(agent: Agent, task_description: str) -> Any:
+    """在子进程中执行任务（模块级函数，便于进程池 pickle）"""
+    return agent.execute_task(task_description)
 
 
 class TaskStatus(Enum):
@@ -18,7 +71,7 @@ class TaskStatus(Enum):
     FAILED = "failed"
 
 
-@dataclass
+@slotted_dataclass
 class Task:
     """任务对象"""
     id: str
@@ -40,10 +93,17 @@ class Orchestrator:
     - 结果聚合
     """
     
-    def __init__(self, agents: Optional[List[Agent]] = None):
+    def __init__(self, agents: Optional[List[Agent]] = None, max_concurrency: int = 8):
         self.agents: Dict[str, Agent] = {}
         self.message_bus = MessageBus()
         self.tasks: List[Task] = []
+        self.max_concurrency = max_concurrency
+        # 空闲 Agent 名称（dict 保持插入顺序，用作有序集合），随 Agent 状态变更维护
+        self._idle: Dict[str, None] = {}
+        # 轮询顺序，队首为下一个被分配的 Agent
+        self._rr: Deque[str] = deque()
+        # Agent 名称快照，添加 Agent 时刷新
+        self._agent_names: Tuple[str, ...] = ()
         
         # 注册 Agent
         if agents:
@@ -54,14 +114,30 @@ class Orchestrator:
         """添加 Agent"""
         if not agent.message_bus:
             agent.message_bus = self.message_bus
+        previous = self.agents.get(agent.name)
         self.agents[agent.name] = agent
         self.message_bus.register(agent)
+        if previous is agent:
+            return
+        if previous is None:
+            self._rr.append(agent.name)
+            self._agent_names += (agent.name,)
+        agent.add_state_listener(self._on_agent_state)
+        self._on_agent_state(agent, agent.state)
+    
+    def _on_agent_state(self, agent: Agent, state: AgentState) -> None:
+        """Agent 状态变更回调，维护空闲 Agent 索引"""
+        if self.agents.get(agent.name) is not agent:
+            return
+        if state == AgentState.IDLE:
+            self._idle[agent.name] = None
+        else:
+            self._idle.pop(agent.name, None)
     
     def create_task(self, description: str, assign_to: Optional[str] = None) -> Task:
         """创建任务"""
-        import uuid
         task = Task(
-            id=str(uuid.uuid4())[:8],
+            id=new_id(),
             description=description,
             assigned_to=assign_to,
         )
@@ -79,7 +155,7 @@ class Orchestrator:
                 - round_robin: 轮询分配
                 - broadcast: 广播给所有 Agent
         """
-        print(f"\n[Orchestrator] 开始执行任务: {task_description}")
+        logger.info("[Orchestrator] 开始执行任务: %s", task_description)
         
         if strategy == "broadcast":
             return self._broadcast_task(task_description)
@@ -91,63 +167,247 @@ class Orchestrator:
     def _auto_assign(self, task_description: str) -> Any:
         """自动分配任务给最合适的 Agent"""
         # 简单实现：选择空闲的 Agent
-        for agent in self.agents.values():
-            if agent.state == AgentState.IDLE:
-                print(f"[Orchestrator] 将任务分配给 {agent.name}")
-                return agent.execute_task(task_description)
+        name = next(iter(self._idle), None)
+        if name is None:
+            logger.warning("[Orchestrator] 没有可用的 Agent")
+            return None
         
-        print("[Orchestrator] 警告：没有可用的 Agent")
-        return None
+        agent = self.agents[name]
+        logger.info("[Orchestrator] 将任务分配给 %s", agent.name)
+        return agent.execute_task(task_description)
     
     def _round_robin_task(self, task_description: str) -> Any:
         """轮询分配任务"""
-        if not self.agents:
+        if not self._rr:
             return None
         
         # 简单轮询
-        agent_names = list(self.agents.keys())
-        last_idx = getattr(self, "_rr_index", 0)
-        agent_name = agent_names[last_idx % len(agent_names)]
-        self._rr_index = last_idx + 1
-        
-        agent = self.agents[agent_name]
-        print(f"[Orchestrator] 轮询分配给 {agent.name}")
+        agent = self.agents[self._rr[0]]
+        self._rr.rotate(-1)
+        logger.info("[Orchestrator] 轮询分配给 %s", agent.name)
         return agent.execute_task(task_description)
     
     def _broadcast_task(self, task_description: str) -> Dict:
-        """广播任务给所有 Agent"""
-        results = {}
-        for name, agent in self.agents.items():
-            print(f"[Orchestrator] 广播任务给 {name}")
-            results[name] = agent.execute_task(task_description)
+        """广播任务给所有 Agent，各 Agent 并发执行"""
+        names = self._agent_names
+        logger.info("[Orchestrator] 广播任务给 %s", ", ".join(names))
+        nodes = {name: (name, task_description) for name in names}
+        return _run_sync(self.run_dag(nodes))
+    
+    async def run_dag(
+        self,
+        nodes: Dict[Hashable, Tuple[str, str]],
+        edges: Iterable[Tuple[Hashable, Hashable]] = (),
+        max_concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+        mode: str = "auto",
+    ) -> Dict[Hashable, Any]:
+        """
+        按依赖图（DAG）并发执行任务
+        
+        入度为 0 的节点进入就绪队列，由至多 max_concurrency 个 worker
+        并发执行；节点完成后其后继节点入度减一，归零即就绪。
+        
+        Args:
+            nodes: {node_id: (agent_name, task_description), ...}
+            edges: [(上游 node_id, 下游 node_id), ...]
+            max_concurrency: 最大并发数，默认使用 self.max_concurrency
+            return_exceptions: 为 True 时将异常作为节点结果返回，而不是向上抛出
+            mode: 执行方式
+                - auto: 声明 cpu_bound 的 Agent 在子进程中执行，其余在事件循环中并发
+                - thread: 全部在事件循环中并发（同步 Agent 使用线程）
+                - process: 全部在子进程中执行
+                子进程以 spawn 方式启动，Agent 需可 pickle 且其类可被导入，状态变更不会同步回当前进程
+        
+        Returns:
+            {node_id: result, ...}
+        """
+        if mode not in PARALLEL_MODES:
+            raise ValueError(f"未知的执行方式: {mode}")
+        
+        successors: Dict[Hashable, List[Hashable]] = {node: [] for node in nodes}
+        in_degree: Dict[Hashable, int] = {node: 0 for node in nodes}
+        for src, dst in edges:
+            if src not in nodes or dst not in nodes:
+                raise ValueError(f"依赖边引用了不存在的节点: ({src}, {dst})")
+            successors[src].append(dst)
+            in_degree[dst] += 1
+        
+        # Kahn 算法预检，避免存在环时 worker 永久等待
+        pending = dict(in_degree)
+        ready = [node for node, degree in pending.items() if degree == 0]
+        visited = 0
+        while ready:
+            node = ready.pop()
+            visited += 1
+            for succ in successors[node]:
+                pending[succ] -= 1
+                if pending[succ] == 0:
+                    ready.append(succ)
+        if visited != len(nodes):
+            raise ValueError("任务依赖图中存在环")
+        
+        results: Dict[Hashable, Any] = {}
+        if not nodes:
+            return results
+        
+        in_process = {
+            node
+            for node, (agent_name, _) in nodes.items()
+            if agent_name in self.agents and self._runs_in_process(self.agents[agent_name], mode)
+        }
+        process_pool = _get_process_pool() if in_process else None
+        loop = asyncio.get_running_loop()
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        for node, degree in in_degree.items():
+            if degree == 0:
+                queue.put_nowait(node)
+        remaining = len(nodes)
+        workers_count = max(1, min(max_concurrency or self.max_concurrency, len(nodes)))
+        
+        async def run_node(node: Hashable) -> Any:
+            agent_name, task_desc = nodes[node]
+            agent = self.agents.get(agent_name)
+            if agent is None:
+                return f"Error: Agent '{agent_name}' not found"
+            try:
+                if node in in_process:
+                    return await loop.run_in_executor(
+                        process_pool, _execute_task_in_process, agent, task_desc
+                    )
+                return await agent.a_execute_task(task_desc)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+        
+        async def worker() -> None:
+            nonlocal remaining
+            while True:
+                node = await queue.get()
+                if node is _STOP:
+                    return
+                results[node] = await run_node(node)
+                for succ in successors[node]:
+                    in_degree[succ] -= 1
+                    if in_degree[succ] == 0:
+                        queue.put_nowait(succ)
+                remaining -= 1
+                if remaining == 0:
+                    for _ in range(workers_count):
+                        queue.put_nowait(_STOP)
+        
+        # 每次调用使用独立的线程池，worker 任务创建时会复制当前上下文
+        thread_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers_count, thread_name_prefix="agent-task"
+        )
+        token = _task_executor.set(thread_pool)
+        try:
+            workers = [asyncio.create_task(worker()) for _ in range(workers_count)]
+        finally:
+            _task_executor.reset(token)
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+            thread_pool.shutdown(wait=False, cancel_futures=True)
         return results
     
-    def run_parallel(self, tasks: List[tuple]) -> Dict:
+    @staticmethod
+    def _runs_in_process(agent: Agent, mode: str) -> bool:
+        """判断 Agent 是否应在子进程中执行"""
+        if mode == "process":
+            return True
+        return mode == "auto" and agent.cpu_bound
+    
+    def run_parallel(self, tasks: List[tuple], mode: str = "auto") -> Dict:
         """
         并行执行多个任务
         
         Args:
             tasks: [(agent_name, task_description), ...]
+            mode: 执行方式 auto / thread / process，见 run_dag
         """
-        import concurrent.futures
+        nodes = {
+            i: (agent_name, task_desc)
+            for i, (agent_name, task_desc) in enumerate(tasks)
+            if agent_name in self.agents
+        }
+        self._prepare_batches(nodes.values())
+        dag_results = _run_sync(self.run_dag(nodes, return_exceptions=True, mode=mode))
         
         results = {}
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = {}
-            for agent_name, task_desc in tasks:
-                if agent_name in self.agents:
-                    agent = self.agents[agent_name]
-                    future = executor.submit(agent.execute_task, task_desc)
-                    futures[future] = agent_name
+        for i, result in dag_results.items():
+            agent_name = nodes[i][0]
+            if isinstance(result, Exception):
+                result = f"Error: {result}"
+            results[agent_name] = result
+        return results
+    
+    def _prepare_batches(self, tasks: Iterable[Tuple[str, str]]) -> None:
+        """按 Agent 类型分组，分派前调用一次各类型的 prepare_batch"""
+        by_type: Dict[type, List[str]] = {}
+        for agent_name, task_desc in tasks:
+            by_type.setdefault(type(self.agents[agent_name]), []).append(task_desc)
+        for agent_type, task_descs in by_type.items():
+            agent_type.prepare_batch(task_descs)
+    
+    def run_parallel_batched(self, tasks: List[tuple]) -> Dict:
+        """
+        并行执行多个任务，可合并的请求只发一次
+        
+        batch_key 相同的 Agent 执行同一任务时（如模型、提示词和历史都相同的 LLMAgent），
+        通过 a_execute_batch 合并为一次调用；其余任务照常并发执行
+        
+        Args:
+            tasks: [(agent_name, task_description), ...]
+        """
+        async def run() -> Dict:
+            singles: Dict[Hashable, Tuple[str, str]] = {}
+            groups: Dict[Hashable, List[Agent]] = {}
+            group_tasks: Dict[Hashable, str] = {}
+            for i, (agent_name, task_desc) in enumerate(tasks):
+                agent = self.agents.get(agent_name)
+                if agent is None:
+                    continue
+                key = agent.batch_key(task_desc)
+                if key is None:
+                    singles[i] = (agent_name, task_desc)
+                else:
+                    group = (type(agent), key)
+                    groups.setdefault(group, []).append(agent)
+                    group_tasks[group] = task_desc
+            
+            group_keys = list(groups)
+            outcomes = await asyncio.gather(
+                self.run_dag(singles, return_exceptions=True),
+                *(
+                    type(groups[key][0]).a_execute_batch(groups[key], group_tasks[key])
+                    for key in group_keys
+                ),
+                return_exceptions=True,
+            )
             
-            for future in concurrent.futures.as_completed(futures):
-                agent_name = futures[future]
-                try:
-                    results[agent_name] = future.result()
-                except Exception as e:
-                    results[agent_name] = f"Error: {e}"
+            results = {}
+            single_results, group_results = outcomes[0], outcomes[1:]
+            if isinstance(single_results, Exception):
+                raise single_results
+            for i, result in single_results.items():
+                results[singles[i][0]] = result
+            for key, group_result in zip(group_keys, group_results):
+                for j, agent in enumerate(groups[key]):
+                    if isinstance(group_result, Exception):
+                        results[agent.name] = group_result
+                    else:
+                        results[agent.name] = group_result[j]
+            return {
+                name: f"Error: {result}" if isinstance(result, Exception) else result
+                for name, result in results.items()
+            }
         
-        return results
+        return _run_sync(run())
     
     def run_sequence(self, tasks: List[tuple]) -> List:
         """
@@ -156,15 +416,10 @@ class Orchestrator:
         Args:
             tasks: [(agent_name, task_description), ...]
         """
-        results = []
-        for agent_name, task_desc in tasks:
-            if agent_name in self.agents:
-                agent = self.agents[agent_name]
-                result = agent.execute_task(task_desc)
-                results.append((agent_name, result))
-            else:
-                results.append((agent_name, f"Error: Agent '{agent_name}' not found"))
-        return results
+        nodes = dict(enumerate(tasks))
+        edges = [(i, i + 1) for i in range(len(tasks) - 1)]
+        dag_results = _run_sync(self.run_dag(nodes, edges))
+        return [(tasks[i][0], dag_results[i]) for i in range(len(tasks))]
     
     def get_status(self) -> Dict:
         """获取编排器状态"""
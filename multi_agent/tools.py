@@ -2,9 +2,19 @@
 工具系统 - Agent 可以使用的工具
 """
 
-from typing import Callable, Any, Dict, List, Optional
+from typing import Callable, Any, Dict, List, Optional, Union, get_args, get_origin
 from dataclasses import dataclass
+import ast
+import copy
+import functools
 import inspect
+import logging
+import math
+import operator
+import types
+import weakref
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -31,6 +41,86 @@ class Tool:
         }
 
 
+# Python 类型注解到 JSON Schema 类型的映射
+_TYPE_MAP = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+    type(None): "null",
+}
+
+
+# typing.Union 以及 Python 3.10+ 的 X | Y 写法
+_UNION_TYPES = (Union, getattr(types, "UnionType", Union))
+
+
+def _json_type(annotation: Any) -> Dict:
+    """把类型注解映射为 JSON Schema 类型；list[int]、Dict[str, int] 等泛型按原始类型处理"""
+    if annotation is None:
+        annotation = type(None)
+    origin = get_origin(annotation)
+    if origin in _UNION_TYPES:
+        # Optional[X] / X | None 按 X 处理
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return _json_type(args[0])
+    schema = {"type": _TYPE_MAP.get(origin or annotation, "string")}
+    if origin is list:
+        args = get_args(annotation)
+        if len(args) == 1:
+            schema["items"] = _json_type(args[0])
+    return schema
+
+
+def _build_parameters(func: Callable) -> Dict:
+    """从函数签名推断参数定义"""
+    sig = inspect.signature(func)
+    properties = {}
+    required = []
+    
+    for param_name, param in sig.parameters.items():
+        # 尝试从类型注解推断，没有注解时默认为字符串
+        if param.annotation is inspect.Parameter.empty:
+            properties[param_name] = {"type": "string"}
+        else:
+            properties[param_name] = _json_type(param.annotation)
+        
+        # 没有默认值的参数是必需的
+        if param.default is inspect.Parameter.empty:
+            required.append(param_name)
+    
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": required,
+    }
+
+
+# 同一函数重复注册（如多个 Agent 注册同一工具）时无需再次反射签名；
+# 弱引用键不会让已注册的函数（及其闭包、绑定的对象）常驻内存
+_parameters_cache: "weakref.WeakKeyDictionary[Callable, Dict]" = weakref.WeakKeyDictionary()
+
+
+def _cached_parameters(func: Callable) -> Dict:
+    """按函数对象缓存的参数定义；返回副本，调用方可自由修改"""
+    try:
+        parameters = _parameters_cache.get(func)
+    except TypeError:
+        # 不可哈希的可调用对象无法缓存
+        return _build_parameters(func)
+    if parameters is None:
+        parameters = _build_parameters(func)
+        try:
+            _parameters_cache[func] = parameters
+        except TypeError:
+            # 不支持弱引用的可调用对象（如内置函数）不缓存
+            return parameters
+    return copy.deepcopy(parameters)
+
+
 class ToolRegistry:
     """
     工具注册表
@@ -40,6 +130,8 @@ class ToolRegistry:
     
     def __init__(self):
         self.tools: Dict[str, Tool] = {}
+        # OpenAI tools 格式的缓存，注册/注销工具时失效
+        self._openai_tools: Optional[List[Dict]] = None
     
     def register(
         self, 
@@ -57,12 +149,14 @@ class ToolRegistry:
             description=description or function.__doc__ or "",
             parameters=parameters,
         )
-        print(f"[ToolRegistry] 工具 '{name}' 已注册")
+        self._openai_tools = None
+        logger.debug("[ToolRegistry] 工具 '%s' 已注册", name)
     
     def unregister(self, name: str) -> None:
         """注销工具"""
         if name in self.tools:
             del self.tools[name]
+            self._openai_tools = None
     
     def get(self, name: str) -> Optional[Tool]:
         """获取工具"""
@@ -70,8 +164,8 @@ class ToolRegistry:
     
     def execute(self, name: str, **kwargs) -> Any:
         """执行工具"""
-        tool = self.get(name)
-        if not tool:
+        tool = self.tools.get(name)
+        if tool is None:
             raise ValueError(f"工具 '{name}' 未找到")
         return tool.execute(**kwargs)
     
@@ -80,66 +174,98 @@ class ToolRegistry:
         return list(self.tools.keys())
     
     def to_openai_tools(self) -> List[Dict]:
-        """转换为 OpenAI tools 格式"""
-        return [tool.to_openai_format() for tool in self.tools.values()]
+        """转换为 OpenAI tools 格式（结果会被缓存，调用方不应修改）"""
+        if self._openai_tools is None:
+            self._openai_tools = [tool.to_openai_format() for tool in self.tools.values()]
+        return self._openai_tools
     
     def _infer_parameters(self, func: Callable) -> Dict:
-        """从函数签名推断参数定义"""
-        sig = inspect.signature(func)
-        properties = {}
-        required = []
-        
-        for param_name, param in sig.parameters.items():
-            param_info = {"type": "string"}  # 默认类型
-            
-            # 尝试从类型注解推断
-            if param.annotation != inspect.Parameter.empty:
-                type_map = {
-                    str: "string",
-                    int: "integer",
-                    float: "number",
-                    bool: "boolean",
-                    list: "array",
-                    dict: "object",
-                }
-                param_info["type"] = type_map.get(param.annotation, "string")
-            
-            properties[param_name] = param_info
-            
-            # 没有默认值的参数是必需的
-            if param.default == inspect.Parameter.empty:
-                required.append(param_name)
-        
-        return {
-            "type": "object",
-            "properties": properties,
-            "required": required,
-        }
+        """从函数签名推断参数定义（按函数对象缓存）"""
+        return _cached_parameters(func)
     
     def __repr__(self) -> str:
         return f"ToolRegistry(tools={self.list_tools()})"
 
 
+# 整数运算结果的位数上限（约 3000 位十进制数），避免 10**1000**1000 之类的表达式耗尽 CPU 和内存
+_MAX_INT_BITS = 10_000
+
+
+def _check_int_bits(bits: int) -> None:
+    if bits > _MAX_INT_BITS:
+        raise ValueError(f"计算结果过大（约 {bits} 位二进制）")
+
+
+def _multiply(left, right):
+    if type(left) is int and type(right) is int:
+        _check_int_bits(left.bit_length() + right.bit_length())
+    return left * right
+
+
+def _power(base, exponent):
+    # 只有整数的正整数次幂会产生任意大的结果；浮点数溢出时直接抛出 OverflowError
+    if type(base) is int and type(exponent) is int and exponent > 0 and abs(base) > 1:
+        # |base| ** exponent 的二进制位数为 floor(exponent * log2|base|) + 1
+        _check_int_bits(int(exponent * math.log2(abs(base))) + 1)
+    return base ** exponent
+
+
+# calculate 工具支持的运算符
+_BIN_OPS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _multiply,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _power,
+}
+_UNARY_OPS: Dict[type, Callable[[Any], Any]] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+def _compile_node(node: ast.AST) -> Callable[[], Any]:
+    """把表达式语法树编译为闭包，只接受数字和算术运算"""
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = node.value
+        return lambda: value
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        op = _UNARY_OPS[type(node.op)]
+        operand = _compile_node(node.operand)
+        return lambda: op(operand())
+    if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+        op = _BIN_OPS[type(node.op)]
+        left = _compile_node(node.left)
+        right = _compile_node(node.right)
+        return lambda: op(left(), right())
+    raise ValueError(f"不支持的表达式：{ast.dump(node)}")
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_expression(expression: str) -> Callable[[], Any]:
+    """解析并编译算术表达式，重复的表达式直接命中缓存"""
+    return _compile_node(ast.parse(expression.strip(), mode="eval").body)
+
+
 # 预定义的通用工具
 def create_default_tools() -> ToolRegistry:
     """创建默认工具集"""
     registry = ToolRegistry()
     
-    @registry.register
     def search(query: str) -> str:
         """搜索互联网信息"""
         # 这里可以集成实际的搜索 API
         return f"搜索结果：{query}"
     
-    @registry.register
     def calculate(expression: str) -> float:
         """计算数学表达式"""
         try:
-            return eval(expression)
-        except:
+            return _compile_expression(expression)()
+        except Exception:
             return 0.0
     
-    @registry.register
     def read_file(path: str) -> str:
         """读取文件内容"""
         try:
@@ -148,4 +274,7 @@ def create_default_tools() -> ToolRegistry:
         except Exception as e:
             return f"读取失败：{e}"
     
-    return registry
\ No newline at end of file
+    for function in (search, calculate, read_file):
+        registry.register(function.__name__, function)
+    
+    return registry
@@ -2,11 +2,39 @@
 测试 Agent 基础功能
 """
 
-import pytest
+import asyncio
+import gc
+import json
 import sys
-sys.path.insert(0, '..')
+import threading
+import weakref
+from typing import Dict, List, Optional
+
+import pytest
+
+from multi_agent import Agent, Memory, Message, MessageBus, Orchestrator, SharedMemory, ToolRegistry
+from multi_agent.agent import AgentState
+from multi_agent.memory import MemoryEntry
+from multi_agent.tools import create_default_tools
+
+
+class EchoAgent(Agent):
+    """回显任务的测试 Agent"""
+    
+    def _do_task(self, task: str, **kwargs) -> str:
+        return f"{self.name}:{task}"
 
-from multi_agent import Agent, MessageBus, Orchestrator
+
+class BarrierAgent(Agent):
+    """在屏障处等待其它任务的测试 Agent，用于验证任务并发执行"""
+    
+    def __init__(self, barrier: threading.Barrier, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.barrier = barrier
+    
+    def _do_task(self, task: str, **kwargs) -> str:
+        self.barrier.wait()
+        return f"{self.name}:{task}"
 
 
 class TestAgent:
@@ -18,6 +46,11 @@ class TestAgent:
         assert agent.name == "TestAgent"
         assert agent.role == "测试"
     
+    def test_agent_has_no_instance_dict(self):
+        """测试 Agent 使用 __slots__"""
+        agent = Agent(name="TestAgent", role="测试")
+        assert not hasattr(agent, "__dict__")
+    
     def test_agent_send_message(self):
         """测试 Agent 发送消息"""
         bus = MessageBus()
@@ -68,6 +101,284 @@ class TestMessageBus:
         
         history = bus.get_history()
         assert len(history) == 1
+    
+    def test_history_cap(self):
+        """测试消息历史容量上限"""
+        bus = MessageBus(history_cap=3)
+        alice = Agent(name="Alice", role="A", message_bus=bus)
+        Agent(name="Bob", role="B", message_bus=bus)
+        
+        for i in range(5):
+            alice.send_to("Bob", f"m{i}")
+        
+        history = bus.get_history()
+        assert [m.content for m in history] == ["m2", "m3", "m4"]
+        assert [m.content for m in bus.get_history("Bob")] == ["m2", "m3", "m4"]
+    
+    def test_history_by_agent(self):
+        """测试按 Agent 过滤消息历史"""
+        bus = MessageBus()
+        alice = Agent(name="Alice", role="A", message_bus=bus)
+        bob = Agent(name="Bob", role="B", message_bus=bus)
+        Agent(name="Carol", role="C", message_bus=bus)
+        
+        alice.send_to("Bob", "a->b")
+        bob.send_to("Carol", "b->c")
+        alice.broadcast("a->all")
+        
+        assert [m.content for m in bus.get_history("Alice")] == ["a->b", "a->all"]
+        assert [m.content for m in bus.get_history("Bob")] == ["a->b", "b->c"]
+        assert [m.content for m in bus.get_history("Carol")] == ["b->c"]
+    
+    def test_zero_history_cap(self):
+        """测试历史容量为 0 时不保留任何消息"""
+        bus = MessageBus(history_cap=0)
+        alice = Agent(name="Alice", role="A", message_bus=bus)
+        Agent(name="Bob", role="B", message_bus=bus)
+        
+        alice.send_to("Bob", "hi")
+        assert bus.get_history() == []
+        assert bus.get_history("Bob") == []
+    
+    def test_history_is_read_only(self):
+        """测试 history 为只读视图，容量已满时按 Agent 的索引与之保持一致"""
+        bus = MessageBus(history_cap=2)
+        alice = Agent(name="Alice", role="A", message_bus=bus)
+        Agent(name="Bob", role="B", message_bus=bus)
+        
+        with pytest.raises(AttributeError):
+            bus.history.append(Message(sender="W", receiver="Bob", content="direct"))
+        with pytest.raises(TypeError):
+            bus.history[0] = Message(sender="W", receiver="Bob", content="direct")
+        
+        for i in range(4):
+            alice.send_to("Bob", f"m{i}")
+        assert [m.content for m in bus.history] == ["m2", "m3"]
+        assert [m.content for m in bus.history[-1:]] == ["m3"]
+        assert [m.content for m in bus.get_history("Bob")] == ["m2", "m3"]
+        assert bus.get_history("W") == []
+        
+        bus.clear_history()
+        assert len(bus.history) == 0
+        assert bus.get_history("Bob") == []
+    
+    def test_hooks(self):
+        """测试消息钩子在点对点和广播时触发"""
+        bus = MessageBus()
+        seen = []
+        bus.add_hook(lambda m: seen.append(m.content))
+        alice = Agent(name="Alice", role="A", message_bus=bus)
+        Agent(name="Bob", role="B", message_bus=bus)
+        
+        assert alice.send_to("Bob", "hi")
+        alice.broadcast("all")
+        assert bus.send(Message(sender="Alice", receiver="Nobody", content="lost")) is False
+        assert seen == ["hi", "all", "lost"]
+        
+        bus.hooks.append(lambda m: seen.append(m.content.upper()))
+        alice.send_to("Bob", "direct")
+        assert seen[-2:] == ["direct", "DIRECT"]
+    
+    def test_load_history_round_trip(self):
+        """测试从导出的 JSON 回放消息历史"""
+        bus = MessageBus()
+        alice = Agent(name="Alice", role="A", message_bus=bus)
+        Agent(name="Bob", role="B", message_bus=bus)
+        alice.send_to("Bob", "hi")
+        alice.broadcast({"k": 1})
+        exported = [m.to_dict() for m in bus.get_history()]
+        
+        replay = MessageBus()
+        assert replay.load_history(json.dumps(exported)) == 2
+        assert [m.to_dict() for m in replay.get_history()] == exported
+        assert [m.content for m in replay.get_history("Bob")] == ["hi"]
+    
+    def test_iter_encoded(self):
+        """测试逐条导出消息历史"""
+        bus = MessageBus()
+        alice = Agent(name="Alice", role="A", message_bus=bus)
+        Agent(name="Bob", role="B", message_bus=bus)
+        
+        alice.send_to("Bob", "hi")
+        alice.broadcast("all")
+        
+        frames = [json.loads(frame) for frame in bus.iter_encoded()]
+        assert frames == [m.to_dict() for m in bus.get_history()]
+
+
+class TestMemory:
+    """测试记忆系统"""
+    
+    def test_search_substring_across_short_and_long_term(self):
+        """测试搜索覆盖短期和长期记忆，且保持子串语义"""
+        memory = Memory(agent_id="a", max_short_term=2)
+        memory.add("研究 AI Agent 框架")
+        memory.add("撰写文章")
+        memory.add("审核 agent 输出")
+        
+        results = memory.search("AGENT")
+        assert [e.content for e in results] == ["审核 agent 输出", "研究 AI Agent 框架"]
+        assert [e.content for e in memory.search("文")] == ["撰写文章"]
+    
+    def test_search_index_is_lazy(self):
+        """测试索引在首次搜索时建立，之后增量维护"""
+        memory = Memory(agent_id="a", max_short_term=2, max_long_term=2)
+        memory.add("alpha")
+        assert not memory._inverted
+        
+        assert [e.content for e in memory.search("ALP")] == ["alpha"]
+        for text in ("beta", "gamma", "alphabet", "delta"):
+            memory.add(text)
+        assert [e.content for e in memory.search("alp")] == ["alphabet"]
+        assert [e.content for e in memory.search("ta")] == ["delta", "beta"]
+    
+    def test_zero_short_term_goes_to_long_term(self):
+        """测试短期记忆容量为 0 时条目直接进入长期记忆"""
+        memory = Memory(agent_id="a", max_short_term=0)
+        memory.add("hello")
+        memory.add("world")
+        
+        assert len(memory.short_term) == 0
+        assert [e.content for e in memory.long_term] == ["hello", "world"]
+        assert [e.content for e in memory.search("world")] == ["world"]
+    
+    def test_memory_lists_are_read_only(self):
+        """测试短期、长期记忆为只读视图，搜索索引不会因外部修改而失效"""
+        memory = Memory(agent_id="a", max_short_term=1)
+        memory.add("alpha")
+        memory.add("beta")
+        
+        with pytest.raises(AttributeError):
+            memory.short_term.append(memory.long_term[0])
+        with pytest.raises(TypeError):
+            MemoryEntry(content="x", _seq=0)
+        assert [e.content for e in memory.search("a")] == ["beta", "alpha"]
+    
+    def test_search_after_clear_short_term(self):
+        """测试清空短期记忆后不再命中"""
+        memory = Memory(agent_id="a")
+        memory.add("hello world")
+        memory.clear_short_term()
+        
+        assert memory.search("hello") == []
+    
+    def test_shared_memory_history_cap(self):
+        """测试共享记忆历史容量上限与按键查询"""
+        shared = SharedMemory(history_cap=3)
+        for i, key in enumerate("abab"):
+            shared.set(key, i)
+        
+        assert [(k, v) for k, v, _ in shared.get_history()] == [("b", 1), ("a", 2), ("b", 3)]
+        assert [v for _, v, _ in shared.get_history("a")] == [2]
+        assert [v for _, v, _ in shared.get_history("b")] == [1, 3]
+        
+        with pytest.raises(AttributeError):
+            shared.history.append(("a", 0, None))
+        shared.clear_history()
+        shared.set("a", 4)
+        assert [v for _, v, _ in shared.get_history("a")] == [4]
+        assert shared.get_history("b") == []
+        
+        empty = SharedMemory(history_cap=0)
+        empty.set("a", 1)
+        assert empty.get("a") == 1
+        assert empty.get_history() == empty.get_history("a") == []
+    
+    def test_iter_encoded_matches_to_dict(self):
+        """测试逐条导出与 to_dict 一致"""
+        memory = Memory(agent_id="a")
+        memory.add("hello", entry_type="task")
+        memory.add({"k": 1})
+        
+        frames = [json.loads(frame) for frame in memory.iter_encoded()]
+        assert frames == memory.to_dict()["short_term"]
+
+
+class TestToolRegistry:
+    """测试工具注册表"""
+    
+    def test_openai_tools_cache_invalidation(self):
+        """测试工具定义缓存在注册/注销后失效"""
+        registry = ToolRegistry()
+        registry.register("a", lambda x: x, "工具 A")
+        first = registry.to_openai_tools()
+        assert registry.to_openai_tools() is first
+        
+        registry.register("b", lambda y: y, "工具 B")
+        assert [t["function"]["name"] for t in registry.to_openai_tools()] == ["a", "b"]
+        
+        registry.unregister("a")
+        assert [t["function"]["name"] for t in registry.to_openai_tools()] == ["b"]
+
+    def test_inferred_parameters_cached_per_function(self):
+        """测试参数定义按函数缓存，但各工具拿到独立的副本，且不持有函数"""
+        def add(a: int, b: float = 1.0) -> float:
+            return a + b
+
+        first, second = ToolRegistry(), ToolRegistry()
+        first.register("add", add)
+        second.register("add", add)
+        params = first.get("add").parameters
+        assert params["properties"] == {"a": {"type": "integer"}, "b": {"type": "number"}}
+        assert params["required"] == ["a"]
+        
+        params["properties"]["a"]["description"] = "加数"
+        assert second.get("add").parameters["properties"]["a"] == {"type": "integer"}
+        
+        ref = weakref.ref(add)
+        del add, first, second, params
+        gc.collect()
+        assert ref() is None
+
+    def test_inferred_parameters_generic_annotations(self):
+        """测试泛型注解保留数组元素类型"""
+        def tag(
+            items: List[int],
+            labels: Dict[str, str],
+            note: None = None,
+            limit: Optional[int] = None,
+            scores: Optional[List[float]] = None,
+        ):
+            return items
+        
+        registry = ToolRegistry()
+        registry.register("tag", tag)
+        assert registry.get("tag").parameters["properties"] == {
+            "items": {"type": "array", "items": {"type": "integer"}},
+            "labels": {"type": "object"},
+            "note": {"type": "null"},
+            "limit": {"type": "integer"},
+            "scores": {"type": "array", "items": {"type": "number"}},
+        }
+    
+    @pytest.mark.skipif(sys.version_info < (3, 10), reason="需要 X | None 语法")
+    def test_inferred_parameters_pipe_optional(self):
+        """测试 X | None 注解按 X 推断"""
+        def f(limit: int | None = None):
+            return limit
+        
+        registry = ToolRegistry()
+        registry.register("f", f)
+        assert registry.get("f").parameters["properties"] == {"limit": {"type": "integer"}}
+
+    def test_calculate_tool(self):
+        """测试默认计算工具只接受算术表达式"""
+        registry = create_default_tools()
+        assert registry.execute("calculate", expression="1 + 2 * 3") == 7
+        assert registry.execute("calculate", expression="-(2 ** 10) / 4") == -256.0
+        assert registry.execute("calculate", expression="__import__('os').getcwd()") == 0.0
+        assert registry.execute("calculate", expression="9 ** 9 ** 9") == 0.0
+        assert registry.execute("calculate", expression="2 ** 100") == 2 ** 100
+        assert registry.execute("calculate", expression="1 ** 10 ** 9") == 1
+        assert registry.execute("calculate", expression="2 ** 6000") == 2 ** 6000
+        assert registry.execute("calculate", expression="2 ** 5001") == 2 ** 5001
+        assert registry.execute("calculate", expression="10 ** 2600") == 10 ** 2600
+        assert registry.execute("calculate", expression="2 ** 9999") == 2 ** 9999
+        assert registry.execute("calculate", expression="2 ** 10000") == 0.0
+        assert registry.execute("calculate", expression="(-3) ** 6309") == (-3) ** 6309
+        assert registry.execute("calculate", expression="3 ** 6310") == 0.0
+        assert registry.execute("calculate", expression="((10 ** 1000) ** 1000) ** 20") == 0.0
+        assert registry.execute("calculate", expression="(10 ** 2000) * (10 ** 2000) * (10 ** 2000)") == 0.0
 
 
 class TestOrchestrator:
@@ -95,6 +406,132 @@ class TestOrchestrator:
         status = orc.get_status()
         assert "agents" in status
         assert "Test" in status["agents"]
+    
+    def test_run_sequence(self):
+        """测试顺序执行"""
+        orc = Orchestrator(agents=[EchoAgent(name="A", role="R"), EchoAgent(name="B", role="R")])
+        results = orc.run_sequence([("A", "t1"), ("B", "t2"), ("C", "t3")])
+        
+        assert results[0] == ("A", "A:t1")
+        assert results[1] == ("B", "B:t2")
+        assert results[2][1].startswith("Error")
+    
+    def test_run_parallel_overlaps_tasks(self):
+        """测试并行执行时任务互相重叠"""
+        barrier = threading.Barrier(3, timeout=5)
+        orc = Orchestrator(agents=[BarrierAgent(barrier, name=f"A{i}", role="R") for i in range(3)])
+        
+        results = orc.run_parallel([(f"A{i}", "t") for i in range(3)])
+        assert results == {f"A{i}": f"A{i}:t" for i in range(3)}
+    
+    def test_broadcast_strategy_runs_all_agents(self):
+        """测试广播策略并发执行所有 Agent"""
+        barrier = threading.Barrier(3, timeout=5)
+        orc = Orchestrator(agents=[BarrierAgent(barrier, name=f"A{i}", role="R") for i in range(3)])
+        
+        results = orc.run("t", strategy="broadcast")
+        assert results == {f"A{i}": f"A{i}:t" for i in range(3)}
+    
+    def test_nested_orchestration(self):
+        """测试 Agent 在任务中再发起编排时不会因线程池占满而死锁"""
+        
+        class OuterAgent(Agent):
+            def _do_task(self, task: str, **kwargs) -> str:
+                barrier = threading.Barrier(2, timeout=5)
+                inner = Orchestrator(
+                    agents=[BarrierAgent(barrier, name=f"{self.name}-{i}", role="R") for i in range(2)]
+                )
+                return sorted(inner.run_parallel([(f"{self.name}-{i}", task) for i in range(2)]).values())
+        
+        orc = Orchestrator(agents=[OuterAgent(name=f"O{i}", role="R") for i in range(4)])
+        results = {}
+        runner = threading.Thread(
+            target=lambda: results.update(orc.run_parallel([(f"O{i}", "t") for i in range(4)])),
+            daemon=True,
+        )
+        runner.start()
+        runner.join(timeout=10)
+        
+        assert not runner.is_alive()
+        assert results == {f"O{i}": [f"O{i}-0:t", f"O{i}-1:t"] for i in range(4)}
+    
+    def test_auto_assign_skips_busy_agents(self):
+        """测试自动分配跳过非空闲的 Agent"""
+        busy, idle = EchoAgent(name="A", role="R"), EchoAgent(name="B", role="R")
+        orc = Orchestrator(agents=[busy, idle])
+        busy.state = AgentState.WORKING
+
+        assert orc.run("t") == "B:t"
+        idle.state = AgentState.ERROR
+        assert orc.run("t") is None
+        busy.state = AgentState.IDLE
+        assert orc.run("t") == "A:t"
+
+    def test_round_robin(self):
+        """测试轮询分配"""
+        orc = Orchestrator(agents=[EchoAgent(name="A", role="R"), EchoAgent(name="B", role="R")])
+
+        results = [orc.run("t", strategy="round_robin") for _ in range(3)]
+        assert results == ["A:t", "B:t", "A:t"]
+
+    def test_sync_api_inside_running_loop(self):
+        """测试在运行中的事件循环里调用同步编排接口"""
+        orc = Orchestrator(agents=[EchoAgent(name="A", role="R"), EchoAgent(name="B", role="R")])
+        
+        async def main():
+            return (
+                orc.run_parallel([("A", "x")]),
+                orc.run("x", strategy="broadcast"),
+                orc.run_sequence([("A", "x"), ("B", "y")]),
+                orc.run_parallel_batched([("A", "x")]),
+            )
+        
+        parallel, broadcast, sequence, batched = asyncio.run(main())
+        assert parallel == {"A": "A:x"}
+        assert broadcast == {"A": "A:x", "B": "B:x"}
+        assert sequence == [("A", "A:x"), ("B", "B:y")]
+        assert batched == {"A": "A:x"}
+    
+    def test_run_parallel_process_mode(self):
+        """测试在子进程中并行执行"""
+        bus_agent = EchoAgent(name="A", role="R")
+        orc = Orchestrator(agents=[bus_agent, EchoAgent(name="B", role="R")])
+        
+        results = orc.run_parallel([("A", "x"), ("B", "y")], mode="process")
+        
+        assert results == {"A": "A:x", "B": "B:y"}
+        assert bus_agent.message_bus is orc.message_bus
+    
+    def test_run_parallel_rejects_unknown_mode(self):
+        """测试未知执行方式"""
+        orc = Orchestrator(agents=[EchoAgent(name="A", role="R")])
+        
+        with pytest.raises(ValueError):
+            orc.run_parallel([("A", "x")], mode="gpu")
+    
+    def test_run_dag_respects_dependencies(self):
+        """测试 DAG 执行遵循依赖顺序"""
+        order = []
+        
+        class RecordingAgent(Agent):
+            def _do_task(self, task: str, **kwargs) -> str:
+                order.append(task)
+                return task
+        
+        orc = Orchestrator(agents=[RecordingAgent(name="R", role="R")])
+        nodes = {"a": ("R", "a"), "b": ("R", "b"), "c": ("R", "c")}
+        results = asyncio.run(orc.run_dag(nodes, [("a", "c"), ("b", "c")]))
+        
+        assert results == {"a": "a", "b": "b", "c": "c"}
+        assert order[-1] == "c"
+    
+    def test_run_dag_rejects_cycle(self):
+        """测试 DAG 存在环时报错"""
+        orc = Orchestrator(agents=[EchoAgent(name="A", role="R")])
+        nodes = {1: ("A", "x"), 2: ("A", "y")}
+        
+        with pytest.raises(ValueError):
+            asyncio.run(orc.run_dag(nodes, [(1, 2), (2, 1)]))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+"""
+测试 LLM Agent（使用伪造的异步客户端，不访问网络）
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from multi_agent import LLMAgent, ToolEnabledAgent, Orchestrator
+
+
+class FakeStream:
+    """模拟流式响应"""
+    
+    def __init__(self, content):
+        self.pieces = [content[i:i + 3] for i in range(0, len(content), 3)]
+    
+    def __aiter__(self):
+        return self._iter()
+    
+    async def _iter(self):
+        for piece in self.pieces:
+            delta = SimpleNamespace(content=piece)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+class FakeCompletions:
+    """模拟 AsyncOpenAI 的 chat.completions"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    async def create(self, model, messages, stream=False, n=1, **kwargs):
+        self.calls.append(messages)
+        content = f"echo:{messages[-1]['content']}"
+        if stream:
+            return FakeStream(content)
+        choices = [
+            SimpleNamespace(index=i, message=SimpleNamespace(content=f"{content}#{i}", tool_calls=None))
+            for i in range(n)
+        ] if n > 1 else [SimpleNamespace(index=0, message=SimpleNamespace(content=content, tool_calls=None))]
+        return SimpleNamespace(choices=choices)
+
+
+class FakeToolCompletions:
+    """模拟先流式返回两个工具调用、再给出最终回复的 chat.completions"""
+    
+    async def create(self, model, messages, stream=False, **kwargs):
+        if stream:
+            return self._tool_call_stream()
+        tool_contents = [m["content"] for m in messages if m.get("role") == "tool"]
+        message = SimpleNamespace(content=" | ".join(tool_contents), tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    
+    async def _tool_call_stream(self):
+        fragments = [
+            (0, "call_0", "weather", '{"city": '),
+            (0, None, None, '"北京"}'),
+            (1, "call_1", "weather", '{"city": "上海"}'),
+        ]
+        for index, call_id, name, arguments in fragments:
+            function = SimpleNamespace(name=name, arguments=arguments)
+            call = SimpleNamespace(index=index, id=call_id, function=function)
+            delta = SimpleNamespace(content=None, tool_calls=[call])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def make_agent(cls=LLMAgent, name="Bot"):
+    agent = cls(name=name, role="助手", api_key="test")
+    completions = FakeCompletions()
+    agent._client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    agent._provider = "openai"
+    return agent, completions
+
+
+class TestLLMAgent:
+    """测试 LLMAgent"""
+    
+    def test_sync_execute_task(self):
+        """测试同步执行任务"""
+        agent, _ = make_agent()
+        assert agent.execute_task("hi") == "echo:hi"
+        assert len(agent.conversation_history) == 2
+    
+    def test_conversation_history_is_bounded(self):
+        """测试对话历史只保留最近的消息"""
+        agent, completions = make_agent()
+        for i in range(15):
+            agent.execute_task(f"q{i}")
+        
+        assert len(agent.conversation_history) == LLMAgent.MAX_HISTORY_MESSAGES
+        assert agent.conversation_history[-2]["content"] == "q14"
+        assert len(completions.calls[-1]) == LLMAgent.MAX_HISTORY_MESSAGES + 1
+    
+    def test_async_execute_task(self):
+        """测试异步执行任务"""
+        agent, completions = make_agent()
+        result = asyncio.run(agent.a_execute_task("hi"))
+        
+        assert result == "echo:hi"
+        assert len(completions.calls) == 1
+    
+    def test_sync_override_is_respected(self):
+        """测试子类重写同步 _do_task 时异步路径仍生效"""
+        class Prefixed(LLMAgent):
+            def _do_task(self, task: str, **kwargs) -> str:
+                return super()._do_task(f"前缀 {task}")
+        
+        agent, _ = make_agent(Prefixed)
+        assert asyncio.run(agent.a_execute_task("hi")) == "echo:前缀 hi"
+    
+    def test_stream_task(self):
+        """测试流式输出"""
+        agent, _ = make_agent()
+        
+        async def collect():
+            return [chunk async for chunk in agent.a_stream_task("hello")]
+        
+        chunks = asyncio.run(collect())
+        assert len(chunks) > 1
+        assert "".join(chunks) == "echo:hello"
+        assert agent.conversation_history[-1]["content"] == "echo:hello"
+    
+    def test_tool_calls_from_stream(self):
+        """测试从流式响应中解析并执行工具调用"""
+        agent = ToolEnabledAgent(name="Helper", role="助手", api_key="test")
+        agent._client = SimpleNamespace(chat=SimpleNamespace(completions=FakeToolCompletions()))
+        agent._provider = "openai"
+        agent.register_tool("weather", lambda city: f"{city}晴", "查询天气")
+        
+        assert agent.execute_task("天气如何") == "北京晴 | 上海晴"
+    
+    def test_run_parallel_batched_merges_identical_requests(self):
+        """测试相同请求合并为一次 n 候选调用"""
+        a, completions = make_agent(name="A")
+        b = LLMAgent(name="B", role="助手", api_key="test")
+        b._client, b._provider = a._client, "openai"
+        b.set_system_prompt(a.system_prompt)
+        c, _ = make_agent(name="C")
+        orc = Orchestrator(agents=[a, b, c])
+        
+        results = orc.run_parallel_batched([("A", "x"), ("B", "x"), ("C", "x")])
+        
+        assert len(completions.calls) == 1
+        assert results == {"A": "echo:x#0", "B": "echo:x#1", "C": "echo:x"}
+        assert b.conversation_history[-1]["content"] == "echo:x#1"
+    
+    def test_orchestrator_runs_llm_agents(self):
+        """测试编排器调度多个 LLM Agent"""
+        a, _ = make_agent(name="A")
+        b, _ = make_agent(name="B")
+        orc = Orchestrator(agents=[a, b])
+        
+        results = orc.run_parallel([("A", "x"), ("B", "y")])
+        assert results == {"A": "echo:x", "B": "echo:y"}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
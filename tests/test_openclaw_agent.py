@@ -0,0 +1,102 @@
+"""
+测试 OpenClaw Agent 适配器的任务分类与子任务分派
+"""
+
+import random
+
+import pytest
+
+from multi_agent import Agent, Orchestrator
+from openclaw_agent import OpenClawAgent, OpenClawOrchestratorAgent
+
+
+def keyword_scan(cls, task: str) -> str:
+    """逐类别扫描关键词的参考实现，与正则分类器的结果应当一致"""
+    task_lower = task.lower()
+    for category, keywords in cls.TASK_KEYWORDS.items():
+        if any(kw in task_lower for kw in keywords):
+            return category
+    return "general"
+
+
+class TestTaskClassification:
+    """测试任务分类"""
+    
+    @pytest.mark.parametrize("task, expected", [
+        ("写代码打开网页", "code"),
+        ("打开网页搜索资料", "search"),
+        ("保存分析报告", "files"),
+        ("Open the URL and READ it", "files"),
+        ("统计数据", "analysis"),
+        ("你好", "general"),
+        ("", "general"),
+    ])
+    def test_category_priority(self, task, expected):
+        """测试命中多个类别时按 TASK_KEYWORDS 的优先级选取"""
+        assert OpenClawAgent()._classify_task(task) == expected
+    
+    def test_matches_keyword_scan(self):
+        """测试随机拼接的任务与逐类别扫描结果一致（含关键词重叠）"""
+        rng = random.Random(0)
+        pieces = [kw for kws in OpenClawAgent.TASK_KEYWORDS.values() for kw in kws]
+        pieces += ["写", "入", "代", "码", "fi", "le", "x", " ", "URL", "Python"]
+        agent = OpenClawAgent()
+        for _ in range(2000):
+            task = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 5)))
+            assert agent._classify_task(task) == keyword_scan(OpenClawAgent, task)
+    
+    def test_subclass_keywords(self):
+        """测试子类覆盖 TASK_KEYWORDS 时使用自己的分类器"""
+        class DocsAgent(OpenClawAgent):
+            TASK_KEYWORDS = {"docs": ["文档"], "code": ["代码"]}
+        
+        assert DocsAgent()._classify_task("给代码写文档") == "docs"
+        assert OpenClawAgent()._classify_task("给代码写文档") == "code"
+
+
+class TestBatchClassification:
+    """测试并行分派前的批量分类"""
+    
+    def test_run_parallel_classifies_batch_once(self):
+        """测试 run_parallel 分派前按类型批量分类，Agent 执行时命中缓存"""
+        class BatchAgent(OpenClawAgent):
+            batches = []
+            
+            @classmethod
+            def prepare_batch(cls, tasks):
+                cls.batches.append(list(tasks))
+                super().prepare_batch(tasks)
+        
+        agents = [BatchAgent(name=f"B{i}") for i in range(3)]
+        orc = Orchestrator(agents=agents)
+        tasks = [("B0", "搜索资料"), ("B1", "写代码"), ("B2", "搜索资料")]
+        
+        OpenClawAgent._classify_cached.cache_clear()
+        results = orc.run_parallel(tasks, mode="thread")
+        
+        assert BatchAgent.batches == [["搜索资料", "写代码", "搜索资料"]]
+        assert results["B0"].startswith("[OpenClaw 搜索]")
+        assert results["B1"].startswith("[OpenClaw 代码]")
+        info = OpenClawAgent._classify_cached.cache_info()
+        assert info.misses == 2 and info.hits == 3
+
+
+class EchoAgent(Agent):
+    """回显任务的测试 Agent"""
+    
+    def _do_task(self, task: str, **kwargs) -> str:
+        return f"{self.name}:{task}"
+
+
+class TestOrchestratorAgent:
+    """测试 OpenClaw 编排器分派子任务"""
+    
+    def test_dispatch_uses_current_sub_agents(self):
+        """测试直接写入 sub_agents 的子 Agent 同样会被分派"""
+        brain = OpenClawOrchestratorAgent()
+        brain.register_sub_agent(EchoAgent(name="Researcher", role="R"))
+        brain.sub_agents["Writer"] = EchoAgent(name="Writer", role="W")
+        
+        result = brain.execute_task("研究并写一篇文章")
+        assert "Researcher:收集相关资料" in result
+        assert "Writer:根据研究结果撰写内容" in result
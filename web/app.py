@@ -8,20 +8,61 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-import json
+from typing import Optional, List, Dict, Any, Set, Deque, Iterable, Iterator
 import asyncio
+import contextlib
+import itertools
+import logging
+from collections import deque
 from datetime import datetime
 
 # 导入核心模块
 from multi_agent import Agent, MessageBus, Orchestrator
+from multi_agent.message import encode_json
 from multi_agent.llm_agent import LLMAgent, ToolEnabledAgent
 
-app = FastAPI(title="Multi-Agent Interaction", version="0.1.0")
+logger = logging.getLogger(__name__)
+
+# WebSocket 事件合并窗口（秒）：窗口内产生的事件合并为一帧发送
+BROADCAST_INTERVAL = 0.01
+
+
+class FastJSONResponse(Response):
+    """使用 encode_json 序列化的 JSON 响应（安装 msgspec 时走原生编码）"""
+    media_type = "application/json"
+    
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def iter_ndjson(frames: Iterable[bytes]) -> Iterator[bytes]:
+    """把逐条编码的 JSON 帧拼接为 NDJSON 流"""
+    for frame in frames:
+        yield frame + b"\n"
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时创建事件队列和广播任务，关闭时停止广播"""
+    state.event_queue = asyncio.Queue()
+    worker = asyncio.create_task(_broadcast_worker(state.event_queue))
+    try:
+        yield
+    finally:
+        worker.cancel()
+        state.event_queue = None
+
+
+app = FastAPI(
+    title="Multi-Agent Interaction",
+    version="0.1.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
+)
 
 # 静态文件和模板
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -34,8 +75,10 @@ class AppState:
         self.bus = MessageBus()
         self.agents: Dict[str, Agent] = {}
         self.orchestrator = Orchestrator()
-        self.messages: List[Dict] = []
-        self.websocket_clients: List[WebSocket] = []
+        self.messages: Deque[Dict] = deque(maxlen=5_000)
+        self.websocket_clients: Set[WebSocket] = set()
+        # 待广播的 WebSocket 事件，由 lifespan 启动的后台任务合并发送
+        self.event_queue: Optional[asyncio.Queue] = None
 
 state = AppState()
 
@@ -82,7 +125,7 @@ async def list_agents():
             "state": agent.state.value,
             "inbox_count": len(agent.inbox),
         })
-    return {"agents": result}
+    return FastJSONResponse({"agents": result})
 
 
 @app.post("/api/agents")
@@ -124,10 +167,9 @@ async def create_agent(data: AgentCreate):
 @app.delete("/api/agents/{name}")
 async def delete_agent(name: str):
     """删除 Agent"""
-    if name not in state.agents:
+    if state.agents.pop(name, None) is None:
         return {"error": "Agent 不存在"}
     
-    del state.agents[name]
     state.bus.unregister(name)
     
     await broadcast_event("agent_deleted", {"name": name})
@@ -144,7 +186,17 @@ async def get_agent_history(name: str):
     agent = state.agents[name]
     history = agent.memory.to_dict()
     
-    return {"history": history}
+    return FastJSONResponse({"history": history})
+
+
+@app.get("/api/agents/{name}/history/stream")
+async def stream_agent_history(name: str):
+    """以 NDJSON 流式导出 Agent 的短期记忆，每行一条"""
+    if name not in state.agents:
+        return {"error": "Agent 不存在"}
+    
+    frames = state.agents[name].memory.iter_encoded()
+    return StreamingResponse(iter_ndjson(frames), media_type="application/x-ndjson")
 
 
 @app.post("/api/messages")
@@ -187,8 +239,8 @@ async def execute_task(data: TaskExecute):
     })
     
     try:
-        # 模拟异步执行
-        result = agent.execute_task(data.task)
+        # 异步执行，避免阻塞事件循环上的其它请求和 WebSocket 客户端
+        result = await agent.a_execute_task(data.task)
         
         await broadcast_event("task_completed", {
             "agent": data.agent_name,
@@ -209,8 +261,16 @@ async def execute_task(data: TaskExecute):
 @app.get("/api/bus/history")
 async def get_bus_history():
     """获取消息总线历史"""
-    history = [msg.to_dict() for msg in state.bus.history[-50:]]  # 最近50条
-    return {"history": history}
+    recent = itertools.islice(state.bus.history, max(0, len(state.bus.history) - 50), None)
+    history = [msg.to_dict() for msg in recent]  # 最近50条
+    return FastJSONResponse({"history": history})
+
+
+@app.get("/api/bus/history/stream")
+async def stream_bus_history(agent: Optional[str] = None):
+    """以 NDJSON 流式导出完整的消息总线历史，可按 Agent 过滤"""
+    frames = state.bus.iter_encoded(agent)
+    return StreamingResponse(iter_ndjson(frames), media_type="application/x-ndjson")
 
 
 @app.get("/api/orchestrator/status")
@@ -226,7 +286,7 @@ async def run_orchestrator(task: str, strategy: str = "auto"):
     await broadcast_event("orchestrator_started", {"task": task})
     
     try:
-        result = state.orchestrator.run(task, strategy)
+        result = await asyncio.to_thread(state.orchestrator.run, task, strategy)
         
         await broadcast_event("orchestrator_completed", {
             "task": task,
@@ -244,7 +304,7 @@ async def run_orchestrator(task: str, strategy: str = "auto"):
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket 连接 - 实时更新"""
     await websocket.accept()
-    state.websocket_clients.append(websocket)
+    state.websocket_clients.add(websocket)
     
     try:
         while True:
@@ -253,22 +313,46 @@ async def websocket_endpoint(websocket: WebSocket):
             if data == "ping":
                 await websocket.send_text("pong")
     except WebSocketDisconnect:
-        state.websocket_clients.remove(websocket)
+        state.websocket_clients.discard(websocket)
 
 
 async def broadcast_event(event_type: str, data: Any):
-    """广播事件到所有 WebSocket 客户端"""
-    message = json.dumps({
+    """广播事件到所有 WebSocket 客户端（入队后立即返回，由后台任务合并发送）"""
+    if state.event_queue is None or not state.websocket_clients:
+        return
+    state.event_queue.put_nowait({
         "type": event_type,
         "data": data,
         "timestamp": datetime.now().isoformat(),
     })
+
+
+async def _broadcast_worker(queue: asyncio.Queue) -> None:
+    """
+    合并发送 WebSocket 事件
     
-    for client in state.websocket_clients:
+    取到一个事件后等待 BROADCAST_INTERVAL，把期间入队的事件一起编码为 JSON 数组，
+    每个客户端每批只发送一帧
+    """
+    while True:
+        batch = [await queue.get()]
+        await asyncio.sleep(BROADCAST_INTERVAL)
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        
         try:
-            await client.send_text(message)
-        except:
-            pass
+            message = encode_json(batch).decode("utf-8")
+            # 并发发送，单个慢客户端不会拖慢其它客户端；发送失败的连接视为已断开
+            clients = list(state.websocket_clients)
+            results = await asyncio.gather(
+                *(client.send_text(message) for client in clients),
+                return_exceptions=True,
+            )
+            for client, result in zip(clients, results):
+                if isinstance(result, Exception):
+                    state.websocket_clients.discard(client)
+        except Exception:
+            logger.exception("WebSocket 事件广播失败")
 
 
 # ============ 启动说明 ============
@@ -283,4 +367,6 @@ if __name__ == "__main__":
     ║  API 文档: http://localhost:8000/docs                  ║
     ╚═══════════════════════════════════════════════════════╝
     """)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # 安装 uvicorn[standard] 后 auto 会选用 uvloop 事件循环和 httptools 解析器；
+    # 应用状态保存在进程内存中，因此只能以单 worker 运行
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="auto", http="auto")
\ No newline at end of file
@@ -2,7 +2,7 @@
 echo "Starting Multi-Agent Interaction Web UI..."
 echo ""
 echo "Installing dependencies..."
-pip install fastapi uvicorn jinja2 python-multipart websockets -q
+pip install fastapi "uvicorn[standard]" jinja2 python-multipart websockets -q
 echo ""
 echo "Starting server..."
 echo ""
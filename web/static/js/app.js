@@ -64,8 +64,9 @@ createApp({
             };
             
             ws.onmessage = (event) => {
+                // 服务端把短时间内的多个事件合并为一个数组发送
                 const data = JSON.parse(event.data);
-                handleWebSocketMessage(data);
+                (Array.isArray(data) ? data : [data]).forEach(handleWebSocketMessage);
             };
             
             ws.onerror = (error) => {